@@ -0,0 +1,126 @@
+"""
+Benchmark: compiled plan objectives (gerrysort.utils.objectives) vs. the original
+per-configuration lambdas of setup_gerrychain.
+
+Runs on a synthetic grid graph (no state data needed), checks that both give the
+same (noise-free) scores and reports scored proposals/second, for the objective
+alone and for full chains.
+
+    python benchmarks/bench_objectives.py [--size 40] [--districts 8] [--proposals 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from functools import partial
+
+import networkx as nx
+import numpy as np
+from gerrychain import Graph, GeographicPartition
+from gerrychain.optimization import SingleMetricOptimizer
+from gerrychain.proposals import recom
+from gerrychain.tree import bipartition_tree
+from gerrychain.updaters import Tally
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gerrysort.utils.objectives import PlanObjective
+
+CONTROLS = ['Republicans', 'Democrats', 'Fair']
+INTERVENTIONS = ['None', 'Competitive', 'Compact', 'Both']
+
+def reference_metric(control, intervention, w, sigma, dem_share):
+    # The lambdas setup_gerrychain used before the compiled objectives
+    w1, w2 = w, 1 - w
+    if control in ['Republicans', 'Democrats']:
+        won = (lambda x, node: x["NREPS"][node] > x["NDEMS"][node]) if control == 'Republicans' else (lambda x, node: x["NDEMS"][node] > x["NREPS"][node])
+        seats = lambda x: sum([1 for node in x.parts if won(x, node)]) / len(x)
+        if intervention == 'Competitive':
+            return lambda x: w1 * (1 - (sum([abs(x["NDEMS"][node] - x["NREPS"][node]) / (x["NDEMS"][node] + x["NREPS"][node] + 1e-9) for node in x.parts]) / len(x))) + w2 * seats(x) + np.random.normal(0, sigma)
+        elif intervention == 'Compact':
+            return lambda x: w1 * (sum([4 * np.pi * (x["area"][node] / (x["perimeter"][node] ** 2 + 1e-9)) for node in x.parts]) / len(x)) + w2 * seats(x) + np.random.normal(0, sigma)
+        elif intervention == 'Both':
+            return lambda x: w1 * ((sum([4 * np.pi * (x["area"][node] / (x["perimeter"][node] ** 2 + 1e-9)) for node in x.parts]) / len(x)) + (1 - (sum([abs(x["NDEMS"][node] - x["NREPS"][node]) / (x["NDEMS"][node] + x["NREPS"][node] + 1e-9) for node in x.parts]) / len(x)))) + w2 * seats(x) + np.random.normal(0, sigma)
+        return lambda x: seats(x) + np.random.normal(0, sigma)
+    if intervention == 'Competitive':
+        return lambda x: (1 - (sum([abs(x["NDEMS"][node] - x["NREPS"][node]) / (x["NDEMS"][node] + x["NREPS"][node] + 1e-9) for node in x.parts]) / len(x))) + np.random.normal(0, sigma)
+    elif intervention == 'Compact':
+        return lambda x: (sum([4 * np.pi * (x["area"][node] / (x["perimeter"][node] ** 2 + 1e-9)) for node in x.parts]) / len(x))
+    elif intervention == 'Both':
+        return lambda x: ((sum([4 * np.pi * (x["area"][node] / (x["perimeter"][node] ** 2 + 1e-9)) for node in x.parts]) / len(x)) + (1 - (sum([abs(x["NDEMS"][node] - x["NREPS"][node]) / (x["NDEMS"][node] + x["NREPS"][node] + 1e-9) for node in x.parts]) / len(x)))) + np.random.normal(0, sigma)
+    return lambda x: (abs((sum([1 for node in x.parts if x["NDEMS"][node] > x["NREPS"][node]]) / len(x)) - dem_share)) + np.random.normal(0, sigma)
+
+def grid_partition(size, districts, seed=0):
+    rng = np.random.default_rng(seed)
+    graph = Graph.from_networkx(nx.convert_node_labels_to_integers(nx.grid_2d_graph(size, size), label_attribute='pos'))
+    for node, data in graph.nodes(data=True):
+        i, j = data['pos']
+        on_boundary = i in (0, size - 1) or j in (0, size - 1)
+        data.update({
+            'TOTPOP': 100, 'NREPS': int(rng.integers(20, 80)), 'area': 1.0,
+            'boundary_node': on_boundary, 'boundary_perim': float((i in (0, size - 1)) + (j in (0, size - 1))),
+            'CONGDIST': (i * size + j) * districts // (size * size), # Equal-population row-major stripes
+        })
+        data['NDEMS'] = 100 - data['NREPS']
+    for u, v in graph.edges:
+        graph.edges[u, v]['shared_perim'] = 1.0
+    updaters = {'TOTPOP': Tally('TOTPOP'), 'NREPS': Tally('NREPS'), 'NDEMS': Tally('NDEMS')}
+    return GeographicPartition(graph, assignment='CONGDIST', updaters=updaters)
+
+def make_optimizer(initial, metric, maximize=True, epsilon=0.05):
+    proposal = partial(recom, pop_col='TOTPOP', pop_target=sum(initial['TOTPOP'].values()) / len(initial),
+                       epsilon=epsilon, node_repeats=1, method=partial(bipartition_tree, allow_pair_reselection=True))
+    return SingleMetricOptimizer(initial_state=initial, proposal=proposal, constraints=[],
+                                 optimization_metric=metric, maximize=maximize)
+
+def run_chain(initial, metric, maximize, proposals, epsilon):
+    optimizer = make_optimizer(initial, metric, maximize, epsilon)
+    start = time.perf_counter()
+    for part in optimizer.tilted_run(proposals, 0.1):
+        metric(part)
+    return proposals / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=40, help='grid side length (size x size precincts)')
+    parser.add_argument('--districts', type=int, default=8)
+    parser.add_argument('--proposals', type=int, default=200)
+    parser.add_argument('--evaluations', type=int, default=2000)
+    args = parser.parse_args()
+
+    initial = grid_partition(args.size, args.districts)
+    # Collect a few plans to evaluate
+    plans = [initial]
+    for part in make_optimizer(initial, lambda x: 0).tilted_run(20, 0.1):
+        plans.append(part)
+
+    print(f'{"control":<12} {"intervention":<12} {"max |diff|":>10} {"ref prop/s":>11} {"new prop/s":>11} {"speedup":>8}')
+    for control in CONTROLS:
+        for intervention in INTERVENTIONS:
+            reference = reference_metric(control, intervention, 0.5, 0.0, 0.48)
+            compiled = PlanObjective(control, intervention, intervention_weight=0.5, sigma=0.0, dem_share=0.48)
+            diff = max(abs(reference(plan) - compiled(plan)) for plan in plans)
+            rates = []
+            for metric in [reference, compiled]:
+                start = time.perf_counter()
+                for k in range(args.evaluations):
+                    # Each proposal is scored by the optimizer and again by find_best_plan
+                    metric(plans[k % len(plans)])
+                    metric(plans[k % len(plans)])
+                rates.append(args.evaluations / (time.perf_counter() - start))
+            print(f'{control:<12} {intervention:<12} {diff:>10.2e} {rates[0]:>11.0f} {rates[1]:>11.0f} {rates[1] / rates[0]:>7.2f}x')
+
+    # Full chains (proposal generation dominates, the objective is evaluated twice per step)
+    for control, intervention in [('Republicans', 'None'), ('Democrats', 'Both')]:
+        reference = reference_metric(control, intervention, 0.5, 0.01, 0.48)
+        compiled = PlanObjective(control, intervention, intervention_weight=0.5, sigma=0.01, dem_share=0.48)
+        random.seed(0)
+        np.random.seed(0)
+        ref_rate = run_chain(initial, reference, True, args.proposals, 0.05)
+        random.seed(0)
+        np.random.seed(0)
+        new_rate = run_chain(initial, compiled, True, args.proposals, 0.05)
+        print(f'chain {control}/{intervention}: {ref_rate:.1f} -> {new_rate:.1f} proposals/s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark: array-based statistics engine (compute_statistics) vs. the per-statistic
+functions of gerrysort.utils.statistics (STATISTICS).
+
+Runs GerrySort on a synthetic state (or a real one with --state), and after
+initialization and every step checks that both give the same model statistics and
+district attributes (exits with status 1 if they do not, so it serves as a regression
+check), then reports the time of one statistics update with each.
+
+    python benchmarks/bench_statistics.py [--scale medium | --state GA] [--npop 10000] [--steps 3] [--repeats 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gerrysort.model import GerrySort
+from gerrysort.utils.initialization import prepare_state
+from gerrysort.utils.synthetic import SYNTHETIC_SCALES, synthetic_state
+from gerrysort.utils.statistics import STATISTICS, compute_statistics, update_statistics
+
+DISTRICT_ATTRS = ['area', 'perimeter', 'compactness', 'competitiveness_score', 'competitive']
+
+def snapshot(model):
+    statistics = {attr: getattr(model, attr) for attr in model.datacollector.model_reporters.values()}
+    districts = {attr: [getattr(dist, attr) for dist in model.congdists] for attr in DISTRICT_ATTRS}
+    return statistics, districts
+
+def same(a, b):
+    if isinstance(a, str) or isinstance(b, str):
+        return a == b
+    return bool(np.allclose(a, b, rtol=1e-12, atol=0, equal_nan=True))
+
+def compare(model):
+    update_statistics(model, STATISTICS)
+    reference = snapshot(model)
+    compute_statistics(model)
+    engine = snapshot(model)
+    return [name for ref, new in zip(reference, engine) for name in ref if not same(ref[name], new[name])]
+
+def timed(fn, model, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(model)
+    return (time.perf_counter() - start) / repeats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--state', default=None, help='real state (data/processed/{state}.geojson) instead of a synthetic one')
+    parser.add_argument('--scale', default='medium', choices=list(SYNTHETIC_SCALES))
+    parser.add_argument('--npop', type=int, default=10000)
+    parser.add_argument('--steps', type=int, default=3)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--population-mode', default='agents', choices=['agents', 'arrays'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    data = None if args.state else prepare_state('SYN', synthetic_state(**SYNTHETIC_SCALES[args.scale], seed=args.seed))
+    model = GerrySort(state=args.state or 'SYN', data=data, npop=args.npop, max_iters=args.steps, ensemble_size=50,
+                      population_mode=args.population_mode, print_output=False)
+    mismatches = compare(model)
+    for _ in range(args.steps):
+        model.step()
+        mismatches += compare(model)
+    print(f'{args.state or args.scale}: {args.npop} voters ({args.population_mode}), {len(model.congdists)} districts, '
+          f'{args.steps + 1} states compared')
+    print('Same statistics:', 'yes' if not mismatches else f'NO ({sorted(set(mismatches))})')
+    if mismatches:
+        sys.exit(1)
+
+    reference = timed(lambda m: update_statistics(m, STATISTICS), model, args.repeats)
+    engine = timed(compute_statistics, model, args.repeats)
+    print(f'{"functions":<10} {reference * 1e3:9.2f} ms/update')
+    print(f'{"engine":<10} {engine * 1e3:9.2f} ms/update  ({reference / engine:.1f}x)')
@@ -0,0 +1,84 @@
+"""
+Check: model checkpoints, restores and branches continue runs exactly.
+
+On a synthetic state, with metrics streamed to a table (--metrics-path directory):
+
+    • restore: a run checkpointed after one step and restored from the checkpoint file
+      (reopening its own metrics table) ends with the same data as the uninterrupted run
+    • branch: branches created all at once (list(model.branch(...))) and then run one
+      after another each give the uninterrupted run's data (common random numbers),
+      write their own metrics tables and leave the parent's table as it was
+
+Exits with status 1 if any check fails.
+
+    python benchmarks/check_checkpoint.py [--scale small] [--population-mode agents] [--steps 3]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gerrysort.model import GerrySort
+from gerrysort.utils.initialization import prepare_state
+from gerrysort.utils.synthetic import SYNTHETIC_SCALES, synthetic_state
+
+def new_model(data, args, metrics_path):
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    model = GerrySort(state='SYN', data=data, npop=args.npop, max_iters=args.steps, ensemble_size=10,
+                      population_mode=args.population_mode, metrics_path=metrics_path, print_output=False)
+    model.random.seed(args.seed)
+    return model
+
+def run(model):
+    while model.running:
+        model.step()
+    return model.datacollector.get_model_vars_dataframe()
+
+def same(a, b):
+    return a.shape == b.shape and all(a[column].equals(b[column]) for column in a)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', default='small', choices=list(SYNTHETIC_SCALES))
+    parser.add_argument('--npop', type=int, default=2000)
+    parser.add_argument('--steps', type=int, default=3)
+    parser.add_argument('--population-mode', default='agents', choices=['agents', 'arrays'])
+    parser.add_argument('--metrics-path', default=None, help='directory of the metrics tables (default: a temporary one)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    directory = args.metrics_path or tempfile.mkdtemp()
+    os.makedirs(directory, exist_ok=True)
+    data = prepare_state('SYN', synthetic_state(**SYNTHETIC_SCALES[args.scale], seed=args.seed))
+    reference = run(new_model(data, args, os.path.join(directory, 'reference.csv')))
+    checks = {}
+
+    # Restore from a checkpoint file onto the run's own metrics table
+    model = new_model(data, args, os.path.join(directory, 'restored.csv'))
+    model.step()
+    checkpoint_file = os.path.join(directory, 'restored.pkl')
+    model.checkpoint(checkpoint_file)
+    restored = GerrySort.restore(checkpoint_file, data=data)
+    checks['restore'] = same(run(restored), reference)
+    # One row per step in the table (the rows from before the checkpoint are not repeated)
+    checks['restore metrics table'] = pd.read_csv(restored.metrics_path)['step'].tolist() == list(range(args.steps + 1))
+
+    # Branches created before any of them runs
+    parent = new_model(data, args, os.path.join(directory, 'parent.csv'))
+    parent.step()
+    parent_data = parent.datacollector.get_model_vars_dataframe()
+    branches = list(parent.branch([{}, {}]))
+    checks['branch common random numbers'] = all(same(run(branch), reference) for branch in branches)
+    checks['branch metrics tables'] = len({branch.metrics_path for branch in branches} | {parent.metrics_path}) == 3
+    checks['parent metrics table'] = same(parent.datacollector.get_model_vars_dataframe(), parent_data)
+
+    for name, ok in checks.items():
+        print(f'{name:<32} {"ok" if ok else "FAILED"}')
+    if not all(checks.values()):
+        sys.exit(1)
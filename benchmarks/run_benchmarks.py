@@ -0,0 +1,136 @@
+"""
+Benchmark suite: the phases of a GerrySort step on synthetic states (no state data
+needed) at small, medium (~GA) and TX scale.
+
+For every scale and population mode it times model initialization, find_best_plan,
+redistrict, self_sort and update_statistics, reports their throughput (and, with
+--memory, peak traced memory) and checks that the fast paths give the same output as
+their reference paths:
+
+    • redistrict: relabeling by optimal assignment (mapping_congdist_ids) vs. by greedy
+      dissolved overlap (same mapping, or one that keeps more area in place)
+    • update_statistics: compute_statistics vs. the per-statistic functions, and the
+      district area/perimeter from the boundary table vs. the dissolved geometry
+
+    python benchmarks/run_benchmarks.py [--scales small medium tx] [--layout grid] [--memory] [--output results.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gerrysort.model import GerrySort
+from gerrysort.utils.initialization import prepare_state
+from gerrysort.utils.redistricting import find_best_plan, mapping_congdist_ids, redistrict, update_mapping
+from gerrysort.utils.statistics import compute_statistics, district_area_perimeter
+from gerrysort.utils.synthetic import SYNTHETIC_SCALES, synthetic_state
+from bench_statistics import compare
+
+# Voters per scale (as run_console.NPOPS for GA and TX)
+SCALE_NPOPS = {'small': 2000, 'medium': 11000, 'tx': 30500}
+
+class Measure:
+    '''
+    Times a block (and records peak traced memory when tracemalloc is tracing).
+    '''
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.peak_memory = tracemalloc.get_traced_memory()[1] - self.start_memory if tracemalloc.is_tracing() else None
+
+def matched_area(model, mapping):
+    # Area of the precincts whose new district keeps its old label under mapping
+    old = model.current_map['CONGDIST']
+    return model.current_map['area'][model.current_map['NEW_CONGDIST'].map(mapping) == old].sum()
+
+def check_mapping(model):
+    assignment, overlap = mapping_congdist_ids(model), mapping_congdist_ids(model, method='overlap')
+    if assignment == overlap:
+        return 'same'
+    return 'better' if matched_area(model, assignment) > matched_area(model, overlap) else 'DIFFERENT'
+
+def same_area_perimeter(model):
+    area, perimeter = district_area_perimeter(model)
+    geometry = [dist.geometry for dist in model.congdists]
+    return bool(np.allclose(area, [g.area for g in geometry], rtol=1e-9) and np.allclose(perimeter, [g.length for g in geometry], rtol=1e-9))
+
+def run_scale(scale, layout, population_mode, ensemble_size, seed):
+    rows = []
+    def record(case, measure, amount, unit, check=None):
+        rows.append({'scale': scale, 'layout': layout, 'population_mode': population_mode, 'case': case,
+                     'seconds': measure.seconds, 'throughput': amount / measure.seconds if measure.seconds > 0 else float('nan'),
+                     'unit': unit, 'peak_memory': measure.peak_memory, 'check': check})
+
+    random.seed(seed)
+    np.random.seed(seed)
+    data = prepare_state('SYN', synthetic_state(**SYNTHETIC_SCALES[scale], layout=layout, seed=seed))
+    npop = SCALE_NPOPS[scale]
+    with Measure() as measure:
+        model = GerrySort(state='SYN', data=data, npop=npop, max_iters=1, ensemble_size=ensemble_size,
+                          population_mode=population_mode, print_output=False)
+    record('init', measure, model.npop, 'voters/s')
+
+    # The phases of one step, in step order
+    with Measure() as measure:
+        find_best_plan(model)
+    record('find_best_plan', measure, ensemble_size, 'proposals/s')
+
+    mapping = check_mapping(model)
+    with Measure() as measure:
+        update_mapping(model, redistrict(model))
+    record('redistrict', measure, len(model.precincts), 'precincts/s', mapping)
+
+    unhappy = int(np.count_nonzero(model.population.is_unhappy)) if population_mode == 'arrays' else \
+              sum(1 for person in model.population if person.is_unhappy)
+    with Measure() as measure:
+        model.self_sort()
+    record('self_sort', measure, unhappy, 'sorted voters/s')
+    model.update_majorities([model.precincts, model.counties, model.congdists])
+    model.update_utilities()
+
+    statistics = 'same' if not compare(model) and same_area_perimeter(model) else 'DIFFERENT'
+    with Measure() as measure:
+        compute_statistics(model)
+    record('update_statistics', measure, 1, 'updates/s', statistics)
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', default=['small', 'medium'], choices=list(SYNTHETIC_SCALES))
+    parser.add_argument('--layout', default='grid', choices=['grid', 'voronoi'])
+    parser.add_argument('--population-modes', nargs='+', default=['agents', 'arrays'], choices=['agents', 'arrays'])
+    parser.add_argument('--ensemble-size', type=int, default=50)
+    parser.add_argument('--memory', action='store_true', help='trace peak memory (slows every case down)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    if args.memory:
+        tracemalloc.start()
+    rows = []
+    for scale in args.scales:
+        for population_mode in args.population_modes:
+            rows += run_scale(scale, args.layout, population_mode, args.ensemble_size, args.seed)
+
+    print(f'{"scale":<8} {"mode":<7} {"case":<18} {"seconds":>9} {"throughput":>14} {"unit":<16} {"peak MiB":>9}  check')
+    for row in rows:
+        memory = f'{row["peak_memory"] / 2**20:9.1f}' if row['peak_memory'] is not None else f'{"-":>9}'
+        print(f'{row["scale"]:<8} {row["population_mode"]:<7} {row["case"]:<18} {row["seconds"]:9.3f} '
+              f'{row["throughput"]:14.1f} {row["unit"]:<16} {memory}  {row["check"] or "-"}')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+    if any(row['check'] == 'DIFFERENT' for row in rows):
+        sys.exit(1)
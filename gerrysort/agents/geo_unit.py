@@ -1,31 +1,38 @@
+from ..utils.sampling import PolygonSampler
+
 import mesa_geo as mg
 import numpy as np
+import shapely
 from math import ceil
-from shapely.geometry import Point
-import random
 
 class GeoAgent(mg.GeoAgent):
     type: str
-    reps: list
-    dems: list
+    reps: set
+    dems: set
     rep_cnt: int
     dem_cnt: int
     num_people: int
     capacity: int
     precincts: list
     color: str
+    area: float
+    perimeter: float
 
     def __init__(self, unique_id, model, geometry, crs, type):
-        super().__init__(unique_id, model, geometry, crs)
         self.type = type
+        super().__init__(unique_id, model, geometry, crs)
         self.num_people = 0
         self.rep_cnt = 0
         self.dem_cnt = 0
         self.color = 'Grey'
+        self._point_sampler = None
+        # Area and perimeter from the precinct boundary table (None: use the geometry)
+        self.area = None
+        self.perimeter = None
 
         if self.type == 'precinct':
-            self.reps = []
-            self.dems = []
+            self.reps = set()
+            self.dems = set()
         elif self.type == 'county':
             self.capacity = 0
             self.precincts = []
@@ -35,14 +42,40 @@ class GeoAgent(mg.GeoAgent):
             self.competitive = None
             self.precincts = []
 
+    @property
+    def geometry(self):
+        # Districts re-dissolve their precincts lazily (only when the geometry is used)
+        if self._geometry is None and self.type == 'congressional' and self.precincts:
+            self._geometry = shapely.union_all([self.model.space.get_precinct_by_id(precinct_id).geometry for precinct_id in self.precincts])
+        return self._geometry
+
+    @geometry.setter
+    def geometry(self, geometry):
+        self._geometry = geometry
+
+    def invalidate_geometry(self):
+        self._geometry = None
+
+    def area_perimeter(self):
+        if self.area is not None:
+            return self.area, self.perimeter
+        return self.geometry.area, self.geometry.length
+
+    @property
+    def point_sampler(self):
+        # Triangulation-based sampler, (re)built lazily when the geometry changes
+        if self._point_sampler is None or self._point_sampler.geometry is not self.geometry:
+            self._point_sampler = PolygonSampler(self.geometry)
+        return self._point_sampler
+
     def random_point(self):
-        min_x, min_y, max_x, max_y = self.geometry.bounds
-        while not self.geometry.contains(
-            random_point := Point(
-                random.uniform(min_x, max_x), random.uniform(min_y, max_y)
-            )):
-            continue
-        return random_point
+        return self.point_sampler.random_point()
+
+    def random_xy(self):
+        return self.point_sampler.random_xy()
+
+    def random_points(self, n):
+        return self.point_sampler.random_points(n)
 
     def update_majority(self):
         if self.rep_cnt > self.dem_cnt:
@@ -74,8 +107,10 @@ class GeoAgent(mg.GeoAgent):
         return 1 - (abs(self.dem_cnt - self.rep_cnt) / self.num_people)
     
     def polsby_popper(self):
-        return 4 * np.pi * (self.geometry.area / (self.geometry.length ** 2 + 1e-9))
+        area, perimeter = self.area_perimeter()
+        return 4 * np.pi * (area / (perimeter ** 2 + 1e-9))
     
     def schwartzberg(self):
-        return 1 / (self.geometry.length / (2 * np.pi * np.sqrt(self.geometry.area / np.pi)))
+        area, perimeter = self.area_perimeter()
+        return 1 / (perimeter / (2 * np.pi * np.sqrt(area / np.pi)))
 
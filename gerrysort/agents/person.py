@@ -1,6 +1,31 @@
+import mesa
 import mesa_geo as mg
 import numpy as np
-import random
+from shapely.geometry import Point
+
+from ..utils.utility import URBANICITY, URBANICITY_OTHER
+from ..utils.distance import discount_options
+
+def location_utility(color, precinct, county, alpha=((1/3), (1/3), (1/3))):
+    """
+    Utility of a voter of party color living in precinct (part of county).
+    """
+    if color == precinct.color:
+        X1 = 1
+    else:
+        X1 = 0
+
+    if color == county.color:
+        X2 = 1
+    else:
+        X2 = 0
+
+    X3 = URBANICITY.get((color, county.COUNTY_RUCACAT), URBANICITY_OTHER)
+
+    # Return utility
+    a1, a2, a3 = alpha
+    utility = X1*a1 + X2*a2 + X3*a3
+    return utility
 
 class PersonAgent(mg.GeoAgent):
     utility: float
@@ -30,153 +55,148 @@ class PersonAgent(mg.GeoAgent):
             X3: urbanicity match (Dems prefer urban, Reps prefer rural)
         '''
         precinct = self.model.space.get_precinct_by_id(precinct_id)
-        if self.color == precinct.color:
-            X1 = 1
-        else:
-            X1 = 0
-
         county = self.model.space.get_county_by_id(precinct.COUNTY_NAME)
-        if self.color == county.color:
-            X2 = 1
-        else:
-            X2 = 0
-        
-        if self.color == 'Red' and county.COUNTY_RUCACAT == 'rural':
-            X3 = 1
-        elif self.color == 'Red' and county.COUNTY_RUCACAT == 'small_town':
-            X3 = 1
-        elif self.color == 'Red' and county.COUNTY_RUCACAT == 'large_town':
-            X3 = .5
-        elif self.color == 'Blue' and county.COUNTY_RUCACAT == 'urban':
-            X3 = 1
-        elif self.color == 'Blue' and county.COUNTY_RUCACAT == 'large_town':
-            X3 = 1
-        elif self.color == 'Blue' and county.COUNTY_RUCACAT == 'small_town':
-            X3 = .5
-        else:
-            X3 = 0.25
-        
-        # Return utility
-        a1, a2, a3 = alpha
-        utility = X1*a1 + X2*a2 + X3*a3
-        return utility
-
-    def calculate_discounted_utility(self, utility, new_location):
-        # Compute Euclidean distance in meters
-        distance_meters = self.geometry.distance(new_location)
-
-        # Convert meters to miles
-        distance_miles = distance_meters * 0.000621371
-
-        # Max distance dictionary (in miles)
-        max_dist_dict = {'MN': 475, 'WI': 360, 'MI': 500, 'OH': 300, 'PA': 330, 'MA': 190, 'NC': 500, 'GA': 385, 'LA': 370, 'TX': 805}
-        max_dist = max_dist_dict[self.model.state]
-
-        # Calculate normalized distance
-        normalized_distance = distance_miles / max_dist
-
-        # Return discounted utility
-        return utility * (1 - (self.model.distance_decay * normalized_distance))
+        return location_utility(self.color, precinct, county, alpha)
 
     def update_utility(self):
         self.utility = self.calculate_utility(self.precinct_id)
         self.is_unhappy = self.utility < self.model.tolerance
 
-    def calculate_delta_U(self, U_new, U_current):
-        """
-        Calculates the change in utility for moving from current location to a new location.
-
-        U_new: utility value of the new location
-        U_current: utility value of the current location
-        """
-        return U_new - U_current
-
-    def calculate_probabilities(self, U_current, potential_utilities):
-        """
-        Calculates the probabilities of moving to each potential new location.
-
-        U_current: utility value of the current location
-        potential_utilities: list of utility values for each potential new location
-        beta: temperature parameter
-        """
-        delta_U = np.array([self.calculate_delta_U(U_new, U_current) for U_new in potential_utilities])
-        exp_values = np.exp(self.model.beta * delta_U)
-        probabilities = exp_values / np.sum(exp_values)
-        return probabilities
-
-    def simulate_movement(self, moving_options, U_current):
+    def simulate_movement(self, options):
         """
         Simulates the movement process for a household.
 
-        moving_options: dictionary storing id, utility, and position of potential moving options
-        U_current: utility value of the current location
+        options: MovingOptions of the household (option 0 is staying put)
         """
-        # Calculate probabilities of moving to each potential new location and choose one
-        potential_utilities = [option['discounted_utility'] for option in moving_options.values()]
-        probabilities = self.calculate_probabilities(U_current, potential_utilities)
-        chosen_key = np.random.choice(list(moving_options.keys()), p=probabilities)
-        chosen_option = moving_options[chosen_key]
-        
+        # Choose one of the options with probabilities softmax(beta * delta_U)
+        chosen = options.choose(self.model.beta)
+
         # Move agent to new location if chosen
-        if chosen_key != '-1':
+        if chosen != 0:
             self.model.space.remove_person_from_space(self)
             self.model.space.add_person_to_space(
                     self,
-                    new_precinct_id=chosen_option['precinct_id'],
-                    new_position=chosen_option['position']
-                )            
+                    new_precinct_id=self.model.space.precinct_ids[options.precinct[chosen]],
+                    new_position=options.position(chosen)
+                )
             self.model.total_moves += 1
-        
+
         # Update agent's utility
-        self.utility = chosen_option['utility']
+        self.utility = float(options.utility[chosen])
 
     def sort(self):
-        # Create dictionary with potental moving options
-        moving_options = {}
-        moving_options['-1'] = {
-            'position': self.geometry,
-            'precinct_id': self.precinct_id,
-            'county_id': self.county_id,
-            'congdist_id': self.congdist_id,
-            'utility': self.utility,
-            'discounted_utility': self.utility
-        }
-        option_cnt = 0
-        while option_cnt < self.model.n_moving_options:
+        # Potential moving options (buffers shared by all agents, option 0 is staying put)
+        space = self.model.space
+        options = self.model.moving_options
+        if space.track_positions:
+            options.reset(space.precinct_index[self.precinct_id], self.utility, self.geometry.x, self.geometry.y)
+        else:
+            options.reset(space.precinct_index[self.precinct_id], self.utility)
+        new_x = new_y = None
+        while options.size <= self.model.n_moving_options:
             # Find counties that are not at capacity and select one at random
-            not_full_capacity_counties = [county for county in self.model.counties if county.num_people < county.capacity and county.unique_id != self.county_id]
-            if len(not_full_capacity_counties) == 0:
+            new_county = space.get_random_county_below_capacity(exclude=self.county_id)
+            if new_county is None:
                 break
-            new_county = random.choice(not_full_capacity_counties)
-            # Make dictionary of TOTPOP for each precinct in the county
-            precincts = {precinct: self.model.space.get_precinct_by_id(precinct).TOTPOP for precinct in new_county.precincts}
-            # Set all TOTPOP values of nan to 0
-            precincts = {k: v if v == v else 0 for k, v in precincts.items()}
-            # Make a probability distribution of precincts based on population
-            precinct_probs = {precinct: precincts[precinct] / sum(precincts.values()) for precinct in precincts}
-            # Pick a random precinct from random county and sample a new location
-            new_precinct_id = random.choices(list(precinct_probs.keys()), weights=list(precinct_probs.values()))[0]
-            new_precinct = self.model.space.get_precinct_by_id(new_precinct_id)
-            new_location = new_precinct.random_point()
-            
-            # Calculate discounted utility
-            utility = self.calculate_utility(new_precinct_id)
-            if self.model.distance_decay == 0:
-                discounted_utility = utility
-            else:
-                discounted_utility = self.calculate_discounted_utility(utility, new_location)
-            
-            # Store moving options
-            option_cnt += 1
-            moving_options[f'{option_cnt}'] = {
-                'position': new_location,
-                'precinct_id': new_precinct_id,
-                'county_id': new_county.unique_id,
-                'congdist_id': self.model.space.precinct_congdist_map[new_precinct_id],
-                'utility': utility,
-                'discounted_utility': discounted_utility
-            }
-
-        # Simulate movement
-        self.simulate_movement(moving_options, self.utility)
-        
\ No newline at end of file
+            # Pick a random precinct from random county (weighted by population) and sample a new location
+            new_precinct_idx = space.sample_precinct_idx(new_county.unique_id)
+            new_precinct = self.model.precincts[new_precinct_idx]
+            if space.track_positions:
+                new_x, new_y = new_precinct.random_xy()
+
+            # Store moving option (discounted below for all options at once)
+            options.add(new_precinct_idx, self.calculate_utility(new_precinct.unique_id), x=new_x, y=new_y)
+
+        # Calculate discounted utilities and simulate movement
+        discount_options(self.model, options)
+        self.simulate_movement(options)
+
+class MovingOptions:
+    """
+    Moving options of the voter that is sorting (index 0 is staying put), kept in
+    preallocated arrays that are reused by every sort: precinct index, utility,
+    discounted utility and x/y position (NaN if positions are not tracked).
+    """
+    def __init__(self, n_moving_options):
+        n = n_moving_options + 1
+        self.size = 0
+        self.precinct = np.zeros(n, dtype=np.int64)
+        self.utility = np.zeros(n, dtype=np.float64)
+        self.discounted_utility = np.zeros(n, dtype=np.float64)
+        self.xy = np.full((n, 2), np.nan)
+        self.weights = np.zeros(n, dtype=np.float64)
+
+    def reset(self, precinct_idx, utility, x=None, y=None):
+        # Start over with staying put (at the voter's current position) as the only option
+        self.size = 0
+        self.add(precinct_idx, utility, utility, x, y)
+
+    def add(self, precinct_idx, utility=0.0, discounted_utility=0.0, x=None, y=None):
+        k = self.size
+        self.precinct[k] = precinct_idx
+        self.utility[k] = utility
+        self.discounted_utility[k] = discounted_utility
+        self.xy[k] = (x, y) if x is not None else (np.nan, np.nan)
+        self.size = k + 1
+
+    def position(self, k):
+        # Point of option k (None if positions are not tracked)
+        return None if np.isnan(self.xy[k, 0]) else Point(self.xy[k])
+
+    def choose(self, beta):
+        """
+        Sample an option with probabilities softmax(beta * delta_U), where delta_U is the
+        change in (discounted) utility from staying put: stable softmax (max subtracted)
+        and one uniform draw against the cumulative weights, as np.random.choice does.
+        """
+        weights = self.weights[:self.size]
+        np.subtract(self.discounted_utility[:self.size], self.discounted_utility[0], out=weights)
+        weights *= beta
+        weights -= weights.max()
+        np.exp(weights, out=weights)
+        np.cumsum(weights, out=weights)
+        return min(int(np.searchsorted(weights, np.random.random() * weights[-1], side='right')), self.size - 1)
+
+class PersonView(PersonAgent):
+    """
+    Lightweight PersonAgent facade over row `index` of an array-backed Population.
+
+    Only created when the population is stored as arrays and the model is visualized;
+    all attributes are read from (and written to) the population arrays.
+    """
+    def __init__(self, population, index, crs):
+        mesa.Agent.__init__(self, index, population.model)
+        self.crs = crs
+        self.population = population
+
+    @property
+    def geometry(self):
+        return Point(self.population.x[self.unique_id], self.population.y[self.unique_id])
+
+    @geometry.setter
+    def geometry(self, position):
+        self.population.x[self.unique_id], self.population.y[self.unique_id] = position.x, position.y
+
+    @property
+    def color(self):
+        return self.population.color(self.unique_id)
+
+    @property
+    def utility(self):
+        return self.population.utility[self.unique_id]
+
+    @property
+    def is_unhappy(self):
+        return self.population.is_unhappy[self.unique_id]
+
+    @property
+    def precinct_id(self):
+        return self.model.space.precinct_ids[self.population.precinct[self.unique_id]]
+
+    @property
+    def county_id(self):
+        return self.model.counties[self.population.county[self.unique_id]].unique_id
+
+    @property
+    def congdist_id(self):
+        return self.model.congdists[self.population.congdist[self.unique_id]].unique_id
@@ -0,0 +1,107 @@
+from .person import PersonView
+from ..utils.utility import BLUE, RED, location_utilities, update_population_utilities
+from ..utils.distance import discount_options
+
+import numpy as np
+
+PARTY_COLORS = ('Blue', 'Red')
+
+class Population:
+    '''
+    Struct-of-arrays store for the voter population (population_mode='arrays').
+
+    Row i holds the state of one voter; precincts, counties and congressional
+    districts are referenced by their position in model.precincts, model.counties
+    and model.congdists. Replaces one PersonAgent per voter; PersonView objects are
+    only created on top of these arrays when the model is visualized.
+    '''
+    party: np.ndarray
+    precinct: np.ndarray
+    county: np.ndarray
+    congdist: np.ndarray
+    utility: np.ndarray
+    is_unhappy: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+
+    def __init__(self, model, capacity):
+        self.model = model
+        self.size = 0
+        self.party = np.zeros(capacity, dtype=np.int8)
+        self.precinct = np.zeros(capacity, dtype=np.int32)
+        self.county = np.zeros(capacity, dtype=np.int32)
+        self.congdist = np.zeros(capacity, dtype=np.int32)
+        self.utility = np.zeros(capacity, dtype=np.float64)
+        self.is_unhappy = np.zeros(capacity, dtype=bool)
+        self.x = np.full(capacity, np.nan)
+        self.y = np.full(capacity, np.nan)
+
+    def __len__(self):
+        return self.size
+
+    def add_many(self, is_red, precinct_idx):
+        '''
+        Append len(precinct_idx) voters at once (positions drawn per precinct in batches).
+        '''
+        rows = np.arange(self.size, self.size + len(precinct_idx))
+        self.size += len(rows)
+        self.party[rows] = np.where(is_red, RED, BLUE)
+        self.model.space.add_person_indices_to_space(self, rows, precinct_idx)
+        return rows
+
+    def trim(self):
+        '''
+        Drop unused preallocated rows.
+        '''
+        for attr in ['party', 'precinct', 'county', 'congdist', 'utility', 'is_unhappy', 'x', 'y']:
+            setattr(self, attr, getattr(self, attr)[:self.size].copy())
+
+    def color(self, i):
+        return PARTY_COLORS[self.party[i]]
+
+    def create_views(self):
+        '''
+        Create PersonView agents on top of the arrays (visualization only).
+        '''
+        return [PersonView(self, i, self.model.space.crs) for i in range(self.size)]
+
+    def calculate_utility(self, i, precinct_idx):
+        return float(location_utilities(self.model, self.party[i], precinct_idx))
+
+    def update_utilities(self):
+        update_population_utilities(self.model)
+
+    def sort(self, i):
+        '''
+        Array-backed counterpart of PersonAgent.sort for voter i.
+        '''
+        space = self.model.space
+        own_county_id = self.model.counties[self.county[i]].unique_id
+        options = self.model.moving_options
+        if space.track_positions:
+            options.reset(self.precinct[i], self.utility[i], self.x[i], self.y[i])
+        else:
+            options.reset(self.precinct[i], self.utility[i])
+        new_x = new_y = None
+        while options.size <= self.model.n_moving_options:
+            # Find counties that are not at capacity and select one at random
+            new_county = space.get_random_county_below_capacity(exclude=own_county_id)
+            if new_county is None:
+                break
+            new_precinct_idx = space.sample_precinct_idx(new_county.unique_id)
+            if space.track_positions:
+                new_x, new_y = self.model.precincts[new_precinct_idx].random_xy()
+            # Utilities are calculated below for all options at once
+            options.add(new_precinct_idx, x=new_x, y=new_y)
+
+        # Calculate (discounted) utilities of the new locations
+        options.utility[1:options.size] = location_utilities(self.model, self.party[i], options.precinct[1:options.size])
+        discount_options(self.model, options)
+
+        # Choose an option (index 0 is staying put)
+        chosen = options.choose(self.model.beta)
+        if chosen != 0:
+            space.remove_person_index_from_space(self, i)
+            space.add_person_index_to_space(self, i, options.precinct[chosen], new_position=options.position(chosen))
+            self.model.total_moves += 1
+        self.utility[i] = options.utility[chosen]
@@ -1,9 +1,19 @@
 from .space import ElectoralDistricts
+from .agents.person import MovingOptions
 from .utils.initialization import *
 from .utils.statistics import *
 from .utils.redistricting import *
+from .utils.utility import setup_utility_tables, update_majority_codes
+from .utils.archive import PlanArchive
+from .utils.profiling import setup_profiler, print_profile
+from .utils.sorting import batched_sort
+from .utils.distance import setup_distances
+from .utils.checkpoint import create_checkpoint, save_checkpoint, load_checkpoint, restore_population, restore_model_state, \
+    random_states, set_random_states
 
 import mesa
+import random
+import numpy as np
 
 class GerrySort(mesa.Model):
     def __init__(self, state='GA', print_output=False, save_plans=False, vis_level=None, data=None, election='PRES20', 
@@ -11,7 +21,12 @@ class GerrySort(mesa.Model):
                  control_rule='CONGDIST', initial_control='Model', tolerance=0.5, beta=100.0,
                  ensemble_size=250, epsilon=0.01, sigma=0.01,
                  n_moving_options=10, distance_decay=0.0, capacity_mul=1.0, 
-                 intervention='None', intervention_weight=0.0):
+                 intervention='None', intervention_weight=0.0, population_mode='agents', sorting_mode='sequential',
+                 distance_mode='exact', n_chains=1, n_workers=None, chain_start='random',
+                 metrics_path=None, overwrite_metrics=False, profile=None, checkpoint=None):
+        # Constructor parameters (stored in checkpoints)
+        self.params = {name: value for name, value in locals().items() if name not in ['self', 'data', 'checkpoint', '__class__']}
+        checkpoint = load_checkpoint(checkpoint) if checkpoint is not None else None
         self.simulation_id = str(uuid.uuid4())[:8]  # Unique simulation ID
         self.state = state
         # Set up the scheduler and space
@@ -19,9 +34,19 @@ class GerrySort(mesa.Model):
         self.space = ElectoralDistricts()
         self.print = print_output
         self.save_plans = save_plans
+        # Plan history (data/generated_maps/{state}_sim_{simulation_id}_plans/, one file per step)
+        self.plan_archive = PlanArchive() if save_plans else None
         self.space.vis_level = vis_level
+        # Distances of moving options between voter positions ('exact') or precinct centroids ('centroid')
+        if distance_mode not in ['exact', 'centroid']:
+            raise ValueError(f'Unknown distance_mode: {distance_mode}')
+        self.distance_mode = distance_mode
+        # Voter positions are only needed for visualization and exact distance-decayed utilities
+        self.space.track_positions = vis_level is not None or (distance_decay > 0 and distance_mode == 'exact')
         self.steps = 0
         self.running = True
+        # Random states to start the next step from (set on branches, see branch)
+        self.start_random_states = None
         # Set model parameters
         self.election = election
         self.max_iters = max_iters
@@ -34,12 +59,37 @@ class GerrySort(mesa.Model):
         self.ensemble_size = ensemble_size
         self.epsilon = epsilon
         self.sigma = sigma
+        # Number of independent redistricting chains (run over a pool of n_workers processes if > 1)
+        self.n_chains = n_chains
+        self.n_workers = n_workers
+        # Chain start of out-of-balance plans: a random assignment ('random') or the current plan rebalanced ('warm')
+        if chain_start not in ['random', 'warm']:
+            raise ValueError(f'Unknown chain_start: {chain_start}')
+        self.chain_start = chain_start
         self.n_moving_options = n_moving_options
+        # Moving options of the voter that is sorting (reused by every sort)
+        self.moving_options = MovingOptions(n_moving_options)
         self.distance_decay = distance_decay
         self.capacity_mul = capacity_mul
         # Set intervention parameters
         self.intervention = intervention
         self.intervention_weight = intervention_weight
+        # Set population storage ('agents': one PersonAgent per voter, 'arrays': struct-of-arrays Population)
+        if population_mode not in ['agents', 'arrays']:
+            raise ValueError(f'Unknown population_mode: {population_mode}')
+        self.population_mode = population_mode
+        # Sort unhappy voters one after another ('sequential') or all at once ('batched', see utils/sorting.py)
+        if sorting_mode not in ['sequential', 'batched']:
+            raise ValueError(f'Unknown sorting_mode: {sorting_mode}')
+        self.sorting_mode = sorting_mode
+        # Stream collected data to a .csv/.parquet table instead of keeping it in memory
+        # (an existing table is only replaced with overwrite_metrics=True, or when it is the
+        # table of the checkpointed run, which is rewritten from the checkpoint)
+        self.metrics_path = metrics_path
+        own_table = checkpoint is not None and metrics_path == checkpoint['params'].get('metrics_path')
+        self.overwrite_metrics = overwrite_metrics or own_table
+        # Per-phase profiling of steps (None, 'time' or 'memory'), adds DataCollector columns
+        setup_profiler(self, profile)
         # Load Initial Plan
         load_data(self, state, data)
         # Initialize model statistics
@@ -49,43 +99,106 @@ class GerrySort(mesa.Model):
         create_counties(self)
         create_congressional_districts(self)
         # Create precinct to county/congressional district map
-        self.space.create_precinct_to_county_map(self.precincts)
-        self.space.create_precinct_to_congdist_map(self.precincts)
-        # Create population
-        create_population(self)
+        self.space.create_precinct_to_county_map(self.precincts, self.prepared['precinct_county_map'])
+        self.space.create_precinct_to_congdist_map(self.precincts, self.prepared['precinct_congdist_map'])
+        self.space.create_index_maps(self.precincts, self.counties, self.congdists)
+        self.space.create_precinct_samplers(self.counties)
+        setup_utility_tables(self)
+        setup_distances(self)
+        # Create precinct dual graph (used for redistricting)
+        setup_graph(self)
+        # Create population (or restore it from a checkpoint)
+        if checkpoint is None:
+            create_population(self)
+        else:
+            restore_population(self, checkpoint)
         # Update majorities
         self.update_majorities([self.precincts, self.counties, self.congdists])
         # Update utility of all agents
         self.update_utilities()
         # Update statistics
-        update_statistics(self, statistics=[competitiveness, compactness,
-                                            efficiency_gap, mean_median, declination, 
-                                            pop_deviation, unhappy_happy, avg_utility, segregation,
-                                            congdist_seats, projected_winner, projected_margin])
+        update_statistics(self)
         # Ininitialize party controlling the state based on initial plan
         if initial_control == 'Model':
             self.control = self.projected_winner
         elif initial_control in ['Democrats', 'Republicans', 'Fair']:
             self.control = initial_control
-        # Setup datacollector and collect data
-        self.datacollector.collect(self)
+        if checkpoint is None:
+            # Setup datacollector and collect data
+            self.datacollector.collect(self)
+            if self.save_plans:
+                self.plan_archive.save(self)
+        else:
+            # Continue where the checkpoint left off
+            restore_model_state(self, checkpoint)
         # Print statistics
         if self.print:
             print_statistics(self)
             print('Model initialized!')
 
+    def checkpoint(self, filename=None):
+        '''
+        Snapshot the model state (saved to filename if given); geometry is not included.
+        '''
+        checkpoint = create_checkpoint(self)
+        if filename is not None:
+            save_checkpoint(checkpoint, filename)
+        return checkpoint
+
+    @classmethod
+    def restore(cls, checkpoint, data=None, **params):
+        '''
+        Recreate a model from a checkpoint (dict or filename) and continue where it left
+        off; params override the checkpointed constructor parameters.
+        '''
+        checkpoint = load_checkpoint(checkpoint)
+        return cls(**{**checkpoint['params'], **params}, data=data, checkpoint=checkpoint)
+
+    def branch(self, scenarios, seeds=None):
+        '''
+        Fork one model per scenario (dict of parameter overrides) from the current state.
+
+        Without seeds all branches continue from the random state of the checkpoint
+        (common random numbers), else branch k from random states seeded with seeds[k].
+        The states are set on each branch's first step, so branches can be created
+        before any of them is run. Streamed metrics of branch k go to metrics_path
+        suffixed with its simulation_id.
+        '''
+        checkpoint = self.checkpoint()
+        for k, scenario in enumerate(scenarios):
+            simulation_id = str(uuid.uuid4())[:8]
+            scenario = dict(scenario)
+            if self.metrics_path is not None and 'metrics_path' not in scenario:
+                root, ext = os.path.splitext(self.metrics_path)
+                scenario['metrics_path'] = f'{root}_{simulation_id}{ext}'
+            model = GerrySort.restore(checkpoint, data=self.prepared, **scenario)
+            model.simulation_id = simulation_id
+            model.start_random_states = random_states(checkpoint, seed=seeds[k] if seeds is not None else None)
+            yield model
+
     def update_majorities(self, maps):
         for map in maps:
             for unit in map:
                 unit.update_majority()
+        update_majority_codes(self)
 
     def update_utilities(self):
-        [agent.update_utility() for agent in self.population]
+        if self.population_mode == 'arrays':
+            self.population.update_utilities()
+        else:
+            [agent.update_utility() for agent in self.population]
 
     def self_sort(self):
         if self.print: print('Sorting...')
         # Move agents if unhappy
         self.total_moves = 0
+        if self.sorting_mode == 'batched':
+            batched_sort(self)
+            return
+        if self.population_mode == 'arrays':
+            for i in np.flatnonzero(self.population.is_unhappy):
+                self.population.sort(i)
+            return
         for agent in self.population:
             if agent.is_unhappy:
                 agent.sort()
@@ -95,11 +208,16 @@ class GerrySort(mesa.Model):
         # Run the MCMC algorithm to find the best plan (optimized for the control party)
         find_best_plan(self)
         # Update the boundaries of the congressional districts and keep track of reassigned precincts
-        reassigned_precincts = redistrict(self)
+        with self.profiler.phase('redistrict'):
+            reassigned_precincts = redistrict(self)
         # Update the precinct to congressional district map
-        update_mapping(self, reassigned_precincts)
+        with self.profiler.phase('update_mapping'):
+            update_mapping(self, reassigned_precincts)
 
     def step(self):
+        if self.start_random_states is not None:
+            set_random_states(self, self.start_random_states)
+            self.start_random_states = None
         self.steps += 1
         if self.print: print(f'Model step {self.steps}...')
 
@@ -109,27 +227,36 @@ class GerrySort(mesa.Model):
         
         # 2. Sort agents
         if self.sorting:
-            self.self_sort()
+            with self.profiler.phase('self_sort'):
+                self.self_sort()
+            self.profiler.count('moves', self.total_moves)
         
         # 3. Update majorities (Election)
-        self.update_majorities([self.precincts, self.counties, self.congdists])
+        with self.profiler.phase('update_majorities'):
+            self.update_majorities([self.precincts, self.counties, self.congdists])
         # Update utility of all agents
-        self.update_utilities()
+        with self.profiler.phase('update_utilities'):
+            self.update_utilities()
         # Update statistics
-        update_statistics(self)
+        with self.profiler.phase('update_statistics'):
+            update_statistics(self)
+        self.profiler.end_step(self)
         
         # Collect data
         self.datacollector.collect(self)
         # Print statistics
         if self.print: print_statistics(self)
         if self.save_plans:
-            filename = f'data/generated_maps/{self.state}_sim_{self.simulation_id}_step_{self.steps}.geojson'
-            save_current_map(self, filename=filename)
+            self.plan_archive.save(self)
         
         # Check if the model should stop
         if self.steps >= self.max_iters:
             self.running = False
+            close_chain_pool(self)
+            if isinstance(self.datacollector, MetricsSink):
+                self.datacollector.flush()
             if self.print: 
+                if self.profiler.enabled: print_profile(self.profiler.report())
                 print(f'Simulation done! (steps={self.steps})')
                 print('------------------------------------')
         else:
@@ -1,8 +1,11 @@
 from .agents.geo_unit import GeoAgent
+from .utils.utility import RED
+from .utils.sampling import AliasTable, IndexedSet
 
 import mesa_geo as mg
+import numpy as np
 import random
-from typing import Dict
+from typing import Dict, List
 
 class ElectoralDistricts(mg.GeoSpace):
     id_person_map: Dict[str, GeoAgent]
@@ -11,6 +14,14 @@ class ElectoralDistricts(mg.GeoSpace):
     id_congdist_map: Dict[str, GeoAgent]
     precinct_county_map: Dict[str, str]
     precinct_congdist_map: Dict[str, str]
+    precinct_ids: List[str]
+    precinct_index: Dict[str, int]
+    county_index: Dict[str, int]
+    congdist_index: Dict[str, int]
+    precinct_county_idx: np.ndarray
+    precinct_congdist_idx: np.ndarray
+    county_precinct_samplers: Dict[str, AliasTable]
+    counties_below_capacity: IndexedSet
 
     def __init__(self):
         super().__init__(crs=5070, warn_crs_conversion=True)
@@ -20,12 +31,25 @@ class ElectoralDistricts(mg.GeoSpace):
         self.id_congdist_map = {}
         self.precinct_county_map = {}
         self.precinct_congdist_map = {}
+        self.precinct_ids = []
+        self.precinct_index = {}
+        self.county_index = {}
+        self.congdist_index = {}
+        self.precinct_county_idx = np.empty(0, dtype=np.int32)
+        self.precinct_congdist_idx = np.empty(0, dtype=np.int32)
+        self.county_precinct_samplers = {}
+        self.counties_below_capacity = IndexedSet()
         self.vis_level = None
+        self.track_positions = True
 
     def add_agents(self, persons):
         for person in persons:
             self.id_person_map[person.unique_id] = person
 
+    def add_person_views(self, views):
+        # PersonView agents of an array-backed population (only added when visualized)
+        super().add_agents(views)
+
     def add_precincts(self, precincts):
         if self.vis_level == 'PRECINCT': super().add_agents(precincts)
         for precinct in precincts:
@@ -41,30 +65,75 @@ class ElectoralDistricts(mg.GeoSpace):
         for congdist in congdists:
             self.id_congdist_map[congdist.unique_id] = congdist
 
-    def create_precinct_to_county_map(self, precincts):
+    def create_precinct_to_county_map(self, precincts, precinct_county_map=None):
+        # precinct_county_map can be precomputed (prepared state)
+        if precinct_county_map is None:
+            precinct_county_map = {precinct.unique_id: precinct.COUNTY_NAME for precinct in precincts}
         for precinct in precincts:
-            # Get county
-            county = self.get_county_by_id(precinct.COUNTY_NAME)
             # Add precinct to county agent
-            county.precincts.append(precinct.unique_id)
-            # Add county to precinct-county map
-            self.precinct_county_map[precinct.unique_id] = precinct.COUNTY_NAME
+            self.get_county_by_id(precinct_county_map[precinct.unique_id]).precincts.append(precinct.unique_id)
+        # Add counties to precinct-county map
+        self.precinct_county_map.update(precinct_county_map)
 
-    def create_precinct_to_congdist_map(self, precincts):
+    def create_precinct_to_congdist_map(self, precincts, precinct_congdist_map=None):
+        # precinct_congdist_map can be precomputed (prepared state)
+        if precinct_congdist_map is None:
+            precinct_congdist_map = {precinct.unique_id: precinct.CONGDIST for precinct in precincts}
         for precinct in precincts:
-            congdist = self.get_congdist_by_id(precinct.CONGDIST)
-            congdist.precincts.append(precinct.unique_id)
-            self.precinct_congdist_map[precinct.unique_id] = precinct.CONGDIST
+            self.get_congdist_by_id(precinct_congdist_map[precinct.unique_id]).precincts.append(precinct.unique_id)
+        self.precinct_congdist_map.update(precinct_congdist_map)
+
+    def create_index_maps(self, precincts, counties, congdists):
+        # Positional indices of the geographical units (used by the array-backed population)
+        self.precinct_ids = [precinct.unique_id for precinct in precincts]
+        self.precinct_index = {precinct_id: i for i, precinct_id in enumerate(self.precinct_ids)}
+        self.county_index = {county.unique_id: i for i, county in enumerate(counties)}
+        self.congdist_index = {congdist.unique_id: i for i, congdist in enumerate(congdists)}
+        self.precinct_county_idx = np.array([self.county_index[self.precinct_county_map[precinct_id]] for precinct_id in self.precinct_ids], dtype=np.int32)
+        self.precinct_congdist_idx = np.array([self.congdist_index[self.precinct_congdist_map[precinct_id]] for precinct_id in self.precinct_ids], dtype=np.int32)
+
+    def create_precinct_samplers(self, counties):
+        # Population-weighted (TOTPOP) precinct sampler per county, built once
+        for county in counties:
+            self.county_precinct_samplers[county.unique_id] = AliasTable(
+                [self.precinct_index[precinct_id] for precinct_id in county.precincts],
+                [self.get_precinct_by_id(precinct_id).TOTPOP for precinct_id in county.precincts]
+            )
+
+    def sample_precinct_idx(self, county_id, k=None):
+        # Draw a precinct index (or an array of k indices) from a county, weighted by TOTPOP
+        sampler = self.county_precinct_samplers[county_id]
+        return sampler.draw() if k is None else sampler.draw_many(k)
+
+    def sample_precinct_id(self, county_id) -> str:
+        return self.precinct_ids[self.county_precinct_samplers[county_id].draw()]
+
+    def create_capacity_index(self, counties):
+        # Index of counties with room for more people (kept up to date by add/remove)
+        self.counties_below_capacity = IndexedSet()
+        for county in counties:
+            self.update_capacity_index(county)
+
+    def update_capacity_index(self, county):
+        if county.num_people < county.capacity:
+            self.counties_below_capacity.add(county.unique_id)
+        else:
+            self.counties_below_capacity.discard(county.unique_id)
+
+    def get_random_county_below_capacity(self, exclude=None) -> GeoAgent:
+        # Random county that is not at capacity (other than county exclude), None if there is none
+        county_id = self.counties_below_capacity.random_choice(exclude=exclude)
+        return None if county_id is None else self.get_county_by_id(county_id)
 
     def add_person_to_space(self, person, new_precinct_id, new_position=None):
         # Update precinct attributes
         precinct = self.get_precinct_by_id(new_precinct_id)
         precinct.num_people += 1
         if person.color == 'Red':
-            precinct.reps.append(person.unique_id)
+            precinct.reps.add(person.unique_id)
             precinct.rep_cnt += 1
         elif person.color == 'Blue':
-            precinct.dems.append(person.unique_id)
+            precinct.dems.add(person.unique_id)
             precinct.dem_cnt += 1
         # Update county attributes
         new_county_id = self.precinct_county_map[new_precinct_id]
@@ -74,6 +143,7 @@ class ElectoralDistricts(mg.GeoSpace):
             county.rep_cnt += 1
         elif person.color == 'Blue':
             county.dem_cnt += 1
+        self.update_capacity_index(county)
         # Update electoral district attributes
         new_congdist_id = self.precinct_congdist_map[new_precinct_id]
         congdist = self.get_congdist_by_id(new_congdist_id)
@@ -88,10 +158,11 @@ class ElectoralDistricts(mg.GeoSpace):
         person.congdist_id = new_congdist_id
         if new_position is not None: 
             person.geometry = new_position
-        else:
+        elif self.track_positions:
             person.geometry = precinct.random_point()
-        # Add agent to map
-        super().add_agents(person)
+        # Add agent to map (only needed for visualization)
+        if self.vis_level is not None:
+            super().add_agents(person)
 
     def remove_person_from_space(self, person):
         # Update precinct attributes
@@ -110,6 +181,7 @@ class ElectoralDistricts(mg.GeoSpace):
             county.rep_cnt -= 1
         elif person.color == 'Blue':
             county.dem_cnt -= 1
+        self.update_capacity_index(county)
         # Update electoral district attributes
         congdist = self.get_congdist_by_id(person.congdist_id)
         congdist.num_people -= 1
@@ -121,9 +193,114 @@ class ElectoralDistricts(mg.GeoSpace):
         person.precinct_id = None
         person.county_id = None
         person.district_id = None
-        person.geometry = None
         # Remove agent to map
-        super().remove_agent(person)
+        if self.vis_level is not None:
+            super().remove_agent(person)
+        person.geometry = None
+
+    def add_person_index_to_space(self, population, i, new_precinct_idx, new_position=None):
+        # Array-backed counterpart of add_person_to_space (person i of a Population)
+        precinct = self.get_precinct_by_id(self.precinct_ids[new_precinct_idx])
+        county_idx = self.precinct_county_idx[new_precinct_idx]
+        congdist_idx = self.precinct_congdist_idx[new_precinct_idx]
+        county = self.get_county_by_id(precinct.COUNTY_NAME)
+        congdist = self.get_congdist_by_id(self.precinct_congdist_map[precinct.unique_id])
+        is_red = population.party[i] == RED
+        for unit in (precinct, county, congdist):
+            unit.num_people += 1
+            if is_red:
+                unit.rep_cnt += 1
+            else:
+                unit.dem_cnt += 1
+        if is_red:
+            precinct.reps.add(i)
+        else:
+            precinct.dems.add(i)
+        self.update_capacity_index(county)
+        # Update person attributes
+        population.precinct[i] = new_precinct_idx
+        population.county[i] = county_idx
+        population.congdist[i] = congdist_idx
+        if new_position is None and self.track_positions:
+            new_position = precinct.random_point()
+        if new_position is not None:
+            population.x[i], population.y[i] = new_position.x, new_position.y
+
+    def add_person_indices_to_space(self, population, rows, precinct_idx):
+        # Batch version of add_person_index_to_space (used for seeding)
+        model = population.model
+        is_red = population.party[rows] == RED
+        county_idx = self.precinct_county_idx[precinct_idx]
+        congdist_idx = self.precinct_congdist_idx[precinct_idx]
+        for units, unit_idx in [(model.precincts, precinct_idx), (model.counties, county_idx), (model.congdists, congdist_idx)]:
+            reps = np.bincount(unit_idx[is_red], minlength=len(units))
+            dems = np.bincount(unit_idx[~is_red], minlength=len(units))
+            for j in np.flatnonzero(reps + dems):
+                units[j].rep_cnt += int(reps[j])
+                units[j].dem_cnt += int(dems[j])
+                units[j].num_people += int(reps[j] + dems[j])
+        # Update person attributes and sample positions per precinct
+        population.precinct[rows] = precinct_idx
+        population.county[rows] = county_idx
+        population.congdist[rows] = congdist_idx
+        order = np.argsort(precinct_idx, kind='stable')
+        precincts, starts = np.unique(precinct_idx[order], return_index=True)
+        for j, members in zip(precincts, np.split(rows[order], starts[1:])):
+            precinct = model.precincts[j]
+            red = population.party[members] == RED
+            precinct.reps.update(members[red].tolist())
+            precinct.dems.update(members[~red].tolist())
+            if self.track_positions:
+                positions = precinct.random_points(len(members))
+                population.x[members], population.y[members] = positions[:, 0], positions[:, 1]
+        for j in np.unique(county_idx):
+            self.update_capacity_index(model.counties[j])
+
+    def move_person_indices(self, population, rows, new_precinct_idx, new_positions=None):
+        # Batch move of persons rows of a Population (remove + add, used by batched sorting)
+        model = population.model
+        is_red = population.party[rows] == RED
+        old_precinct_idx = population.precinct[rows]
+        new_county_idx = self.precinct_county_idx[new_precinct_idx]
+        new_congdist_idx = self.precinct_congdist_idx[new_precinct_idx]
+        for units, old_idx, new_idx in [(model.precincts, old_precinct_idx, new_precinct_idx),
+                                        (model.counties, population.county[rows], new_county_idx),
+                                        (model.congdists, population.congdist[rows], new_congdist_idx)]:
+            reps = np.bincount(new_idx[is_red], minlength=len(units)) - np.bincount(old_idx[is_red], minlength=len(units))
+            dems = np.bincount(new_idx[~is_red], minlength=len(units)) - np.bincount(old_idx[~is_red], minlength=len(units))
+            for j in np.flatnonzero(reps | dems):
+                units[j].rep_cnt += int(reps[j])
+                units[j].dem_cnt += int(dems[j])
+                units[j].num_people += int(reps[j] + dems[j])
+        for i, old_j, new_j, red in zip(rows.tolist(), old_precinct_idx.tolist(), new_precinct_idx.tolist(), is_red.tolist()):
+            (model.precincts[old_j].reps if red else model.precincts[old_j].dems).remove(i)
+            (model.precincts[new_j].reps if red else model.precincts[new_j].dems).add(i)
+        for j in np.unique(np.concatenate([population.county[rows], new_county_idx])):
+            self.update_capacity_index(model.counties[j])
+        # Update person attributes
+        population.precinct[rows] = new_precinct_idx
+        population.county[rows] = new_county_idx
+        population.congdist[rows] = new_congdist_idx
+        if new_positions is not None:
+            population.x[rows], population.y[rows] = new_positions[:, 0], new_positions[:, 1]
+
+    def remove_person_index_from_space(self, population, i):
+        # Array-backed counterpart of remove_person_from_space (person i of a Population)
+        precinct = self.get_precinct_by_id(self.precinct_ids[population.precinct[i]])
+        county = self.get_county_by_id(precinct.COUNTY_NAME)
+        congdist = self.get_congdist_by_id(self.precinct_congdist_map[precinct.unique_id])
+        is_red = population.party[i] == RED
+        for unit in (precinct, county, congdist):
+            unit.num_people -= 1
+            if is_red:
+                unit.rep_cnt -= 1
+            else:
+                unit.dem_cnt -= 1
+        if is_red:
+            precinct.reps.remove(i)
+        else:
+            precinct.dems.remove(i)
+        self.update_capacity_index(county)
 
     def get_random_person_id(self) -> str:
         return random.choice(list(self.id_person_map.keys()))
@@ -0,0 +1,116 @@
+import os
+import tempfile
+import numpy as np
+import geopandas as gpd
+import shapely
+
+'''
+PLAN ARCHIVE
+One shared precinct geometry table per state plus, per run, one small compressed
+array file per saved step with the precinct -> district assignment and R/D counts
+(instead of one GeoJSON per step). load_plan rebuilds any step as the GeoDataFrame
+save_current_map would have written.
+'''
+PLAN_ARCHIVE_DIR = os.path.join('data', 'generated_maps')
+
+def write_npz(filename, **arrays):
+    # Write a compressed .npz to a temporary file next to filename and move it into place
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(filename) or '.', suffix='.tmp', delete=False) as f:
+        try:
+            np.savez_compressed(f, **arrays)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, filename)
+
+def save_precinct_geometry(model, filename):
+    '''
+    Store the precinct geometries (WKB), VTDID and COUNTYFP of the state once (written
+    atomically, as parallel runs share the file).
+    '''
+    wkbs = shapely.to_wkb(np.array([precinct.geometry for precinct in model.precincts], dtype=object))
+    lengths = np.fromiter((len(wkb) for wkb in wkbs), dtype=np.int64, count=len(wkbs))
+    write_npz(
+        filename,
+        vtdid=np.array([precinct.unique_id for precinct in model.precincts]),
+        countyfp=np.array([precinct.COUNTYFP for precinct in model.precincts]),
+        wkb=np.frombuffer(b''.join(wkbs), dtype=np.uint8),
+        wkb_offsets=np.concatenate([[0], np.cumsum(lengths)]),
+        crs=np.array(model.space.crs.to_wkt()),
+    )
+
+def load_precinct_geometry(filename):
+    with np.load(filename) as table:
+        wkb, offsets = table['wkb'].tobytes(), table['wkb_offsets']
+        geometry = shapely.from_wkb([wkb[start:end] for start, end in zip(offsets[:-1], offsets[1:])])
+        return gpd.GeoDataFrame({'VTDID': table['vtdid'], 'COUNTYFP': table['countyfp']}, geometry=geometry, crs=str(table['crs']))
+
+def step_file(run_directory, step):
+    return os.path.join(run_directory, f'step_{step:05d}.npz')
+
+def plan_steps(run_directory):
+    # Steps archived in a run's directory (in order)
+    return sorted(int(name[5:-4]) for name in os.listdir(run_directory) if name.startswith('step_') and name.endswith('.npz'))
+
+class PlanArchive:
+    '''
+    Per-run plan history: for every saved step the district of each precinct (uint8
+    index into the district ids) and its Republican/Democrat counts, written right away
+    as one compressed file per step (step_{step:05d}.npz) in the run's directory
+    ({state}_sim_{simulation_id}_plans). Precinct geometry lives in the shared
+    {state}_{fingerprint}_precincts.npz.
+    '''
+    def __init__(self, directory=PLAN_ARCHIVE_DIR):
+        self.directory = directory
+        self.run_directory = None
+
+    def start(self, model):
+        os.makedirs(self.directory, exist_ok=True)
+        self.geometry_file = os.path.join(self.directory, f'{model.state}_{model.prepared["fingerprint"]}_precincts.npz')
+        if not os.path.exists(self.geometry_file):
+            save_precinct_geometry(model, self.geometry_file)
+        self.congdist_ids = np.array([congdist.unique_id for congdist in model.congdists])
+        self.run_directory = os.path.join(self.directory, f'{model.state}_sim_{model.simulation_id}_plans')
+        os.makedirs(self.run_directory, exist_ok=True)
+        # A run restored from a checkpoint keeps its earlier steps (later ones are rewritten)
+        for step in plan_steps(self.run_directory):
+            if step >= model.steps:
+                os.remove(step_file(self.run_directory, step))
+
+    def save(self, model):
+        '''
+        Write the current plan and precinct counts of model to the run's directory.
+        '''
+        if self.run_directory is None:
+            self.start(model)
+        counts = np.array([[precinct.rep_cnt for precinct in model.precincts], [precinct.dem_cnt for precinct in model.precincts]])
+        counts = counts.astype(np.min_scalar_type(max(int(counts.max()), 1)))
+        write_npz(
+            step_file(self.run_directory, model.steps),
+            congdist_ids=self.congdist_ids,
+            assignment=model.space.precinct_congdist_idx.astype(np.uint8),
+            reps=counts[0],
+            dems=counts[1],
+            geometry_file=np.array(os.path.basename(self.geometry_file)),
+        )
+        if model.print: print(f'Plan of step {model.steps} archived in {self.run_directory}')
+
+def load_plan(run_directory, step=-1):
+    '''
+    GeoDataFrame of the plan saved at step (default: last saved step) in a run's
+    directory, with the columns of save_current_map (geometry, NREPS, NDEMS, TOTPOP,
+    VTDID, COUNTYFP, CONGDIST, area, perimeter). The geometry table is looked up next to
+    the run's directory.
+    '''
+    if step == -1:
+        step = plan_steps(run_directory)[-1]
+    with np.load(step_file(run_directory, step)) as record:
+        congdist = record['congdist_ids'][record['assignment']]
+        reps, dems = record['reps'].astype(np.int64), record['dems'].astype(np.int64)
+        geometry_file = os.path.join(os.path.dirname(os.path.normpath(run_directory)), str(record['geometry_file']))
+    plan = load_precinct_geometry(geometry_file)
+    plan['NREPS'], plan['NDEMS'], plan['TOTPOP'] = reps, dems, reps + dems
+    plan['CONGDIST'] = congdist
+    plan['area'], plan['perimeter'] = plan.geometry.area, plan.geometry.length
+    return plan[['geometry', 'NREPS', 'NDEMS', 'TOTPOP', 'VTDID', 'COUNTYFP', 'CONGDIST', 'area', 'perimeter']]
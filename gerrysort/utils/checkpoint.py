@@ -0,0 +1,147 @@
+from ..agents.person import PersonAgent
+from ..agents.population import Population
+from .initialization import setup_county_capacity
+from .redistricting import update_mapping
+from .sampling import IndexedSet
+from .utility import RED, BLUE
+
+import copy
+import pickle
+import random
+import uuid
+import numpy as np
+from shapely.geometry import Point
+
+'''
+MODEL CHECKPOINTS
+Compact model state (voters, district assignment, control, statistics, collected data
+and RNG states) without geometry; the geometry is rebuilt from the prepared state.
+'''
+def create_checkpoint(model):
+    '''
+    Snapshot the state of model as a dict of arrays and plain Python objects.
+    '''
+    if model.population_mode == 'arrays':
+        population = model.population
+        party, precinct = population.party.copy(), population.precinct.copy()
+        positions = np.column_stack([population.x, population.y]) if model.space.track_positions else None
+    else:
+        party = np.array([RED if person.color == 'Red' else BLUE for person in model.population], dtype=np.int8)
+        precinct = np.array([model.space.precinct_index[person.precinct_id] for person in model.population], dtype=np.int32)
+        positions = np.array([(person.geometry.x, person.geometry.y) for person in model.population]).reshape(-1, 2) if model.space.track_positions else None
+    # A branch that has not stepped yet starts from its own random states
+    states = model.start_random_states or (random.getstate(), np.random.get_state(), model.random.getstate())
+    return {
+        'params': dict(model.params),
+        'fingerprint': model.prepared['fingerprint'],
+        'simulation_id': model.simulation_id,
+        'steps': model.steps,
+        'running': model.running,
+        'control': model.control,
+        'party': party,
+        'precinct': precinct,
+        'positions': positions,
+        'congdist': [precinct.CONGDIST for precinct in model.precincts],
+        'counties_below_capacity': list(model.space.counties_below_capacity),
+        'statistics': {attr: getattr(model, attr) for attr in model.datacollector.model_reporters.values()},
+        'model_vars': copy.deepcopy(model.datacollector.model_vars),
+        'district_vars': copy.deepcopy(getattr(model.datacollector, 'district_vars', None)),
+        'random_state': states[0],
+        'np_random_state': states[1],
+        'model_random_state': states[2],
+    }
+
+def save_checkpoint(checkpoint, filename):
+    with open(filename, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_checkpoint(checkpoint):
+    '''
+    checkpoint can be a checkpoint dict or the filename of a saved checkpoint.
+    '''
+    if isinstance(checkpoint, dict):
+        return checkpoint
+    with open(checkpoint, 'rb') as f:
+        return pickle.load(f)
+
+def restore_population(model, checkpoint):
+    '''
+    Counterpart of create_population: add the checkpointed voters (instead of sampling
+    them) and move precincts to their checkpointed districts.
+    '''
+    assert checkpoint['fingerprint'] == model.prepared['fingerprint'], 'Checkpoint was taken on different state data'
+    party, precinct_idx, positions = checkpoint['party'], checkpoint['precinct'], checkpoint['positions']
+    model.total_cap = 0
+    for county in model.counties:
+        setup_county_capacity(model, county)
+    model.nreps = int(np.count_nonzero(party == RED))
+    model.ndems = len(party) - model.nreps
+    if model.population_mode == 'arrays':
+        model.population = Population(model, len(party))
+        model.population.party[:] = party
+        model.population.size = len(party)
+        model.space.add_person_indices_to_space(model.population, np.arange(len(party)), precinct_idx)
+        if positions is not None:
+            model.population.x[:], model.population.y[:] = positions[:, 0], positions[:, 1]
+    else:
+        model.population = []
+        for i, j in enumerate(precinct_idx.tolist()):
+            precinct_id = model.space.precinct_ids[j]
+            person = PersonAgent(
+                unique_id=uuid.uuid4().int,
+                model=model,
+                crs=model.space.crs,
+                geometry=None,
+                is_red=party[i] == RED,
+                precinct_id=precinct_id,
+                county_id=model.space.precinct_county_map[precinct_id],
+                congdist_id=model.space.precinct_congdist_map[precinct_id]
+            )
+            new_position = Point(positions[i]) if positions is not None else None
+            model.space.add_person_to_space(person, new_precinct_id=precinct_id, new_position=new_position)
+            model.schedule.add(person)
+            model.population.append(person)
+    # Same order as when checkpointed (random county picks depend on it)
+    model.space.counties_below_capacity = IndexedSet(checkpoint['counties_below_capacity'])
+    # Add people to the space
+    if model.population_mode == 'arrays':
+        if model.space.vis_level is not None:
+            model.space.add_person_views(model.population.create_views())
+    else:
+        model.space.add_agents(model.population)
+    model.npop = len(model.population)
+    # Move precincts to their checkpointed districts
+    reassigned_precincts = {precinct.unique_id: congdist_id for precinct, congdist_id in zip(model.precincts, checkpoint['congdist']) if precinct.CONGDIST != congdist_id}
+    update_mapping(model, reassigned_precincts)
+    for congdist in model.congdists:
+        congdist.invalidate_geometry()
+
+def restore_model_state(model, checkpoint):
+    '''
+    Restore control, step counter, statistics, collected data and RNG states (call
+    after the model is initialized, so the run continues exactly as it would have).
+    '''
+    model.simulation_id = checkpoint['simulation_id']
+    model.steps = checkpoint['steps']
+    model.running = model.steps < model.max_iters
+    model.control = checkpoint['control']
+    for attr, value in checkpoint['statistics'].items():
+        setattr(model, attr, value)
+    model.datacollector.model_vars = copy.deepcopy(checkpoint['model_vars'])
+    if checkpoint.get('district_vars') is not None and hasattr(model.datacollector, 'district_vars'):
+        model.datacollector.district_vars = copy.deepcopy(checkpoint['district_vars'])
+    set_random_states(model, random_states(checkpoint))
+
+def random_states(checkpoint=None, seed=None):
+    '''
+    States of random, np.random and model.random: those of checkpoint, or of the
+    generators seeded with seed.
+    '''
+    if seed is not None:
+        return random.Random(seed).getstate(), np.random.RandomState(seed).get_state(), random.Random(seed).getstate()
+    return checkpoint['random_state'], checkpoint['np_random_state'], checkpoint['model_random_state']
+
+def set_random_states(model, states):
+    random.setstate(states[0])
+    np.random.set_state(states[1])
+    model.random.setstate(states[2])
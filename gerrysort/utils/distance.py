@@ -0,0 +1,60 @@
+import numpy as np
+import shapely
+
+'''
+DISTANCE ENGINE
+Distance-decayed utilities of moving options, computed for whole option batches:
+
+    discounted utility = utility * (1 - distance_decay * distance / maximum moving distance)
+
+• distance_mode='exact': distance between the voter's position and the sampled
+  position of the option (positions are tracked as float coordinates)
+• distance_mode='centroid': distance between the centroids of the voter's precinct and
+  the option's precinct (precomputed once), so voter positions need not be tracked or
+  sampled for large populations
+'''
+# Maximum moving distance per state (miles), normalizes the distance decay
+MAX_DIST = {'MN': 475, 'WI': 360, 'MI': 500, 'OH': 300, 'PA': 330, 'MA': 190, 'NC': 500, 'GA': 385, 'LA': 370, 'TX': 805}
+METERS_TO_MILES = 0.000621371
+
+def setup_distances(model):
+    '''
+    Precompute the precinct centroids and the maximum moving distance of the state
+    (the diagonal of its bounding box for states not in MAX_DIST, e.g. synthetic ones).
+    '''
+    geometry = np.array([precinct.geometry for precinct in model.precincts], dtype=object)
+    model.precinct_centroids = shapely.get_coordinates(shapely.centroid(geometry))
+    if model.state in MAX_DIST:
+        model.max_dist = MAX_DIST[model.state]
+    else:
+        xmin, ymin, xmax, ymax = shapely.total_bounds(geometry)
+        model.max_dist = float(np.hypot(xmax - xmin, ymax - ymin)) * METERS_TO_MILES
+
+def distance_meters(model, from_precinct, from_xy, to_precinct, to_xy):
+    '''
+    Distance (meters) from positions from_xy in precincts from_precinct to positions
+    to_xy in precincts to_precinct (broadcast, positions have a trailing axis of 2).
+    With distance_mode='centroid' the precinct centroids are used and the positions
+    are ignored (may be None).
+    '''
+    if model.distance_mode == 'centroid':
+        from_xy, to_xy = model.precinct_centroids[from_precinct], model.precinct_centroids[to_precinct]
+    delta = to_xy - from_xy
+    return np.sqrt(delta[..., 0] ** 2 + delta[..., 1] ** 2)
+
+def discounted_utilities(model, utility, distance_meters):
+    # Convert meters to miles and normalize by the maximum moving distance of the state (in miles)
+    normalized_distance = distance_meters * METERS_TO_MILES / model.max_dist
+    return utility * (1 - (model.distance_decay * normalized_distance))
+
+def discount_options(model, options):
+    '''
+    Set the discounted utilities of moving options 1.. (option 0, staying put, holds the
+    voter's precinct and position) in one pass.
+    '''
+    k = options.size
+    if model.distance_decay == 0:
+        options.discounted_utility[1:k] = options.utility[1:k]
+        return
+    distance = distance_meters(model, options.precinct[0], options.xy[0], options.precinct[1:k], options.xy[1:k])
+    options.discounted_utility[1:k] = discounted_utilities(model, options.utility[1:k], distance)
@@ -1,22 +1,132 @@
 from ..agents.person import PersonAgent
+from ..agents.population import Population
 from ..agents.geo_unit import GeoAgent
+from .metrics import MetricsSink
 
 import os
+import hashlib
+import pickle
+import tempfile
 import mesa
 import mesa_geo as mg
 import geopandas as gpd
+import shapely
 from math import ceil
+import numpy as np
 import uuid
 import random
 
+PREPARED_CACHE_DIR = os.path.join('data', 'cache')
+
+def data_fingerprint(data):
+    '''
+    Hash of the precinct ids and geometries (identifies the precinct layout of a state).
+    '''
+    digest = hashlib.sha1()
+    digest.update('|'.join(data['VTDID'].astype(str)).encode())
+    for wkb in shapely.to_wkb(data.geometry.values):
+        digest.update(wkb)
+    return digest.hexdigest()[:16]
+
+def prepare_state(state, data, election='PRES20', crs=5070, source=None):
+    '''
+    Validate and reproject the precinct table of a state and derive everything the
+    model builds from it: dissolved counties and initial congressional districts,
+    precinct-to-county/district maps and the data fingerprint.
+    '''
+    if len(data[~data.geometry.is_valid]) > 0:
+        data = data.copy()
+        data['geometry'] = data.geometry.buffer(0)
+    data = data.to_crs(crs)
+    # Aggregate data by county
+    county_data = data[['COUNTY_NAME', 'COUNTYFP', 
+                        f'{election}R', f'{election}D', f'{election}TOT',
+                        'COUNTY_RUCACAT', 'COUNTY_HOUSEHOLDS', 'COUNTY_HOUSING_UNITS', 
+                        'COUNTY_TOTPOP', 'COUNTY_TOTPOP_SHARE', 'COUNTY_CAPACITY', 'geometry']]
+    agg_funcs = {
+        'COUNTY_NAME': 'first',
+        f'{election}R': 'sum',
+        f'{election}D': 'sum',
+        f'{election}TOT': 'sum',
+        'COUNTY_RUCACAT': 'first',
+        'COUNTY_HOUSEHOLDS': 'first',
+        'COUNTY_HOUSING_UNITS': 'first',
+        'COUNTY_TOTPOP': 'first',
+        'COUNTY_TOTPOP_SHARE': 'first',
+        'COUNTY_CAPACITY': 'first',
+    }
+    county_data = county_data.dissolve(by='COUNTYFP', aggfunc=agg_funcs).reset_index()
+    # Aggregate data by congressional district
+    congdist_data = data[['CONGDIST', f'{election}R', f'{election}D', f'{election}TOT', 'geometry']]
+    congdist_data = congdist_data.dissolve(by='CONGDIST', aggfunc='sum').reset_index()
+    return {
+        'state': state,
+        'election': election,
+        'source': source,
+        'data': data,
+        'counties': county_data,
+        'congdists': congdist_data,
+        'precinct_county_map': dict(zip(data['VTDID'], data['COUNTY_NAME'])),
+        'precinct_congdist_map': dict(zip(data['VTDID'], data['CONGDIST'])),
+        'fingerprint': data_fingerprint(data),
+    }
+
+def source_signature(filename):
+    # Size and modification time of the source file (cache invalidation key)
+    stat = os.stat(filename)
+    return {'filename': os.path.abspath(filename), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def load_prepared_state(state, election='PRES20', crs=5070, data_dir=os.path.join('data', 'processed'), cache_dir=PREPARED_CACHE_DIR, verbose=False):
+    '''
+    Load the prepared state from cache_dir, (re)building it from data_dir/{state}.geojson
+    when there is no (readable) cache yet or the source file changed since it was cached.
+    The cache is written to a unique temporary file and moved into place, so parallel
+    runs never read or write a partial cache.
+    '''
+    filename = os.path.join(data_dir, state + '.geojson')
+    source = source_signature(filename)
+    cache_file = os.path.join(cache_dir, f'{state}_{election}_{crs}_prepared.pkl')
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                prepared = pickle.load(f)
+            if prepared['source'] == source:
+                if verbose: print(f'Loaded prepared state from {cache_file}')
+                return prepared
+        except Exception as e:
+            # Unreadable cache (e.g. cut short by a crash): treat as a cache miss
+            if verbose: print(f'Could not load prepared state from {cache_file} ({e}), rebuilding it')
+    prepared = prepare_state(state, gpd.read_file(filename), election=election, crs=crs, source=source)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as f:
+            try:
+                pickle.dump(prepared, f, protocol=pickle.HIGHEST_PROTOCOL)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, cache_file)
+    except OSError as e:
+        if verbose: print(f'Could not cache prepared state: {e}')
+    return prepared
+
 def load_data(model, state, data):
+    '''
+    data can be None (load data/processed/{state}.geojson through the prepared-state
+    cache), a precinct GeoDataFrame, or a prepared state from load_prepared_state.
+    '''
     model.state = state
     if data is None:
-        data = gpd.read_file(os.path.join('data/processed', state + '.geojson'))
-    if len(data[~data.geometry.is_valid]) > 0:
-        data['geometry'] = data.geometry.buffer(0)
-    model.data = data.to_crs(model.space.crs)
-    assert model.data.crs == model.space.crs, f'CRS mismatch: data=({model.precincts.crs}); space=({model.fitness_landscape.crs})'
+        prepared = load_prepared_state(state, model.election, model.space.crs.to_epsg(), verbose=model.print)
+    elif isinstance(data, dict):
+        prepared = data
+    else:
+        prepared = prepare_state(state, data, election=model.election, crs=model.space.crs)
+    assert prepared['election'] == model.election, f'Prepared state is for {prepared["election"]}, not {model.election}'
+    model.prepared = prepared
+    model.data = prepared['data']
+    assert model.data.crs == model.space.crs, f'CRS mismatch: data=({model.data.crs}); space=({model.space.crs})'
 
 def setup_datacollector(model):
     # Agent statistics
@@ -56,8 +166,7 @@ def setup_datacollector(model):
     model.max_popdev = 0
     model.avg_popdev = 0
     model.change_map = 0
-    model.datacollector = mesa.DataCollector(
-        {'unhappy': 'unhappy', 
+    model_reporters = {'unhappy': 'unhappy', 
          'unhappyreps': 'unhappyreps',
          'unhappydems': 'unhappydems',
          'happy': 'happy',
@@ -88,7 +197,14 @@ def setup_datacollector(model):
          'max_popdev': 'max_popdev',
          'avg_popdev': 'avg_popdev',
          'change_map': 'change_map'
-        })
+        }
+    # Per-step profile columns (only when the model is profiled)
+    model_reporters.update({column: column for column in model.profiler.columns})
+    # Keep collected data in memory, or stream it to model.metrics_path (also per-district vectors)
+    if model.metrics_path is None:
+        model.datacollector = mesa.DataCollector(model_reporters)
+    else:
+        model.datacollector = MetricsSink(model_reporters, model.metrics_path, overwrite=model.overwrite_metrics)
 
 def create_precincts(model):
     # Select relevant columns
@@ -103,25 +219,8 @@ def create_precincts(model):
     if model.print: print(f'{model.num_precincts} precincts added.')
 
 def create_counties(model):
-    # Select relevant columns
-    county_data = model.data[['COUNTY_NAME', 'COUNTYFP', 
-                            f'{model.election}R', f'{model.election}D', f'{model.election}TOT',
-                            'COUNTY_RUCACAT', 'COUNTY_HOUSEHOLDS', 'COUNTY_HOUSING_UNITS', 
-                            'COUNTY_TOTPOP', 'COUNTY_TOTPOP_SHARE', 'COUNTY_CAPACITY', 'geometry']]
-    # Aggregate data by county
-    agg_funcs = {
-        'COUNTY_NAME': 'first',
-        f'{model.election}R': 'sum',
-        f'{model.election}D': 'sum',
-        f'{model.election}TOT': 'sum',
-        'COUNTY_RUCACAT': 'first',
-        'COUNTY_HOUSEHOLDS': 'first',
-        'COUNTY_HOUSING_UNITS': 'first',
-        'COUNTY_TOTPOP': 'first',
-        'COUNTY_TOTPOP_SHARE': 'first',
-        'COUNTY_CAPACITY': 'first',
-    }
-    county_data = county_data.dissolve(by='COUNTYFP', aggfunc=agg_funcs).reset_index()
+    # Counties are dissolved once when the state is prepared
+    county_data = model.prepared['counties']
    # Create county agents and add to the model
     ac_c = mg.AgentCreator(GeoAgent, model=model, agent_kwargs={'type': 'county'})
     model.counties = ac_c.from_GeoDataFrame(county_data, unique_id='COUNTY_NAME')
@@ -130,9 +229,8 @@ def create_counties(model):
     if model.print: print(f'{model.num_counties} counties added.')
 
 def create_congressional_districts(model):
-    # Select relevant columns and aggregate data by congressional district
-    congdist_data = model.data[['CONGDIST', f'{model.election}R', f'{model.election}D', f'{model.election}TOT', 'geometry']]
-    congdist_data = congdist_data.dissolve(by='CONGDIST', aggfunc='sum').reset_index()
+    # Initial congressional districts are dissolved once when the state is prepared
+    congdist_data = model.prepared['congdists']
     # Create congressional district agents and add to the model
     ac_congdist = mg.AgentCreator(GeoAgent, model=model, agent_kwargs={'type': 'congressional'})
     model.congdists = ac_congdist.from_GeoDataFrame(congdist_data, unique_id='CONGDIST')
@@ -140,30 +238,46 @@ def create_congressional_districts(model):
     model.space.add_congdists(model.congdists)
     if model.print: print(f'{model.num_congdists} congressional districts added')
 
+def setup_county_capacity(model, county):
+    '''
+    Set the county capacity (and update the state total) from its initial number of
+    people, which is returned.
+    '''
+    pop_county = ceil(county.COUNTY_TOTPOP_SHARE * model.npop)
+    county.capacity = ceil((county.COUNTY_CAPACITY / county.COUNTY_TOTPOP) * pop_county * model.capacity_mul)
+    model.total_cap += county.capacity
+    if model.print: print(f'{county.unique_id} County has {pop_county} people and {county.capacity} capacity')
+    return pop_county
+
 def create_population(model):
     # Initialize model state variables
     model.population = []
     model.ndems = 0
     model.nreps = 0
     model.total_cap = 0
+    if model.population_mode == 'arrays':
+        model.population = Population(model, sum(ceil(county.COUNTY_TOTPOP_SHARE * model.npop) for county in model.counties))
+        # Republican share of the two-party vote per precinct (0.5 if there were no votes)
+        rep_votes = np.array([getattr(precinct, f"{model.election}R") for precinct in model.precincts], dtype=np.float64)
+        dem_votes = np.array([getattr(precinct, f"{model.election}D") for precinct in model.precincts], dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rep_v_dem_ratios = np.where(rep_votes + dem_votes == 0, 0.5, rep_votes / (rep_votes + dem_votes))
     # Add people to the model
     for county in model.counties:
-        # Determine initial number of people in the county
-        pop_county = ceil(county.COUNTY_TOTPOP_SHARE * model.npop)
-        # Set county capacity (update state total capacity)
-        county.capacity = ceil((county.COUNTY_CAPACITY / county.COUNTY_TOTPOP) * pop_county * model.capacity_mul)
-        model.total_cap += county.capacity
-        if model.print: print(f'{county.unique_id} County has {pop_county} people and {county.capacity} capacity')
-        # Make dictionary of TOTPOP for each precinct in the county
-        precincts = {precinct: model.space.get_precinct_by_id(precinct).TOTPOP for precinct in county.precincts}
-        # Set all TOTPOP values of nan to 0
-        precincts = {k: v if v == v else 0 for k, v in precincts.items()}
-        # Make a probability distribution of precincts based on population
-        precinct_probs = {precinct: precincts[precinct] / sum(precincts.values()) for precinct in precincts}
-        for _ in range(pop_county):
-            # Select precinct based on population distribution
-            random_precinct_id = random.choices(list(precinct_probs.keys()), weights=list(precinct_probs.values()))[0]
-            random_precinct = model.space.get_precinct_by_id(random_precinct_id)
+        # Determine initial number of people and capacity of the county
+        pop_county = setup_county_capacity(model, county)
+        # Select precincts based on population distribution (all people of the county at once)
+        random_precinct_idxs = model.space.sample_precinct_idx(county.unique_id, pop_county)
+        if model.population_mode == 'arrays':
+            # Seed the whole county in one batch
+            is_red = rep_v_dem_ratios[random_precinct_idxs] > np.random.random(pop_county)
+            model.population.add_many(is_red, random_precinct_idxs)
+            model.nreps += int(np.count_nonzero(is_red))
+            model.ndems += pop_county - int(np.count_nonzero(is_red))
+            continue
+        for random_precinct_idx in random_precinct_idxs.tolist():
+            random_precinct = model.precincts[random_precinct_idx]
+            random_precinct_id = random_precinct.unique_id
             # Determine ratio of Republicans to Democrats in the precinct (use try except)
             try:
                 rep_v_dem_ratio = getattr(random_precinct, f"{model.election}R") / (getattr(random_precinct, f"{model.election}D") + getattr(random_precinct, f"{model.election}R"))
@@ -173,7 +287,7 @@ def create_population(model):
                 unique_id=uuid.uuid4().int,
                 model=model,
                 crs=model.space.crs,
-                geometry=random_precinct.random_point(), # Random point in precinct (strictly for visualization purposes)
+                geometry=None, # Random point in precinct is sampled when added to the space (if positions are tracked)
                 is_red=rep_v_dem_ratio > random.random(),
                 precinct_id=random_precinct.unique_id,
                 county_id=model.space.precinct_county_map[random_precinct.unique_id],
@@ -187,8 +301,13 @@ def create_population(model):
                 model.nreps += 1
             elif person.color == 'Blue':
                 model.ndems += 1
+    model.space.create_capacity_index(model.counties)
     # Add people to the space
-    model.space.add_agents(model.population)
+    if model.population_mode == 'arrays':
+        model.population.trim()
+        if model.space.vis_level is not None:
+            model.space.add_person_views(model.population.create_views())
+    else:
+        model.space.add_agents(model.population)
     model.npop = len(model.population)
     if model.print:  print(f'Number of people added: {model.npop}')
-    
\ No newline at end of file
@@ -0,0 +1,172 @@
+import csv
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+'''
+STREAMING METRICS SINK
+Drop-in replacement for mesa.DataCollector (collect, model_vars,
+get_model_vars_dataframe) that appends each step's row to a CSV file or a Parquet
+dataset in batches instead of keeping the whole run in memory, and also records
+per-district vectors every step.
+'''
+METRICS_BATCH_SIZE = 64
+
+# Per-district columns (recorded every step, one row per district)
+DISTRICT_COLUMNS = {
+    'district': lambda dist: dist.unique_id,
+    'rep_cnt': lambda dist: dist.rep_cnt,
+    'dem_cnt': lambda dist: dist.dem_cnt,
+    'num_people': lambda dist: dist.num_people,
+    'color': lambda dist: dist.color,
+    'competitiveness': lambda dist: dist.competitiveness_score,
+    'compactness': lambda dist: dist.compactness,
+}
+
+def value_type(value):
+    if isinstance(value, (bool, np.bool_)):
+        return 'bool'
+    elif isinstance(value, (int, np.integer)):
+        return 'int'
+    elif isinstance(value, (float, np.floating)):
+        return 'float'
+    return 'str'
+
+def column_types(rows):
+    '''
+    Column types ('bool', 'int', 'float' or 'str') of a batch of rows: a column is 'int'
+    only if all its values are integers (columns without values are 'float').
+    '''
+    types = {}
+    for column in rows[0]:
+        kinds = {value_type(row[column]) for row in rows if row[column] is not None}
+        types[column] = next((kind for kind in ['str', 'float', 'int', 'bool'] if kind in kinds), 'float')
+    return types
+
+class TableWriter:
+    '''
+    Append-only typed table: a CSV file, or a Parquet dataset (directory with one part
+    file per flush; needs pyarrow). Column types are set by the first batch (integer
+    columns are promoted to float when later batches need it). An existing table at
+    path is only replaced with overwrite=True.
+    '''
+    def __init__(self, path, overwrite=False):
+        self.path = path
+        self.format = 'parquet' if path.endswith('.parquet') else 'csv'
+        self.types = None
+        self.parts = 0
+        # Start from an empty table
+        if os.path.exists(path) and not overwrite:
+            raise FileExistsError(f'Metrics table {path} already exists (pass overwrite=True to replace it)')
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def write(self, rows):
+        if not rows:
+            return
+        types = column_types(rows)
+        if self.types is None:
+            self.types = types
+        # Integer columns that get floats (e.g. map_score starts at 0) become float columns
+        for column, kind in types.items():
+            if kind == 'float' and self.types[column] == 'int':
+                self.types[column] = 'float'
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            arrow_types = {'bool': pa.bool_(), 'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+            schema = pa.schema([(column, arrow_types[kind]) for column, kind in self.types.items()])
+            os.makedirs(self.path, exist_ok=True)
+            columns = {column: [None if row[column] is None else (str(row[column]) if kind == 'str' else row[column]) for row in rows] for column, kind in self.types.items()}
+            pq.write_table(pa.Table.from_pydict(columns, schema=schema), os.path.join(self.path, f'part-{self.parts:05d}.parquet'))
+            self.parts += 1
+            return
+        new_file = not os.path.exists(self.path)
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.types))
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+
+    def read(self):
+        if self.types is None:
+            return pd.DataFrame()
+        if self.format == 'parquet':
+            import pyarrow.parquet as pq
+            # Part by part, as later parts may have promoted column types
+            parts = sorted(os.listdir(self.path))
+            return pd.concat([pq.read_table(os.path.join(self.path, part)).to_pandas() for part in parts], ignore_index=True)
+        dtypes = {'bool': 'boolean', 'int': 'Int64', 'float': 'float64', 'str': 'object'}
+        # Keep strings such as 'None' as they are (missing values are empty fields)
+        return pd.read_csv(self.path, dtype={column: dtypes[kind] for column, kind in self.types.items()},
+                           keep_default_na=False, na_values=[''])
+
+class MetricsSink:
+    '''
+    Streaming counterpart of mesa.DataCollector for the model reporters: rows are
+    buffered and appended to path (.csv or .parquet) every batch_size steps. Per-district
+    vectors (DISTRICT_COLUMNS) go to a second table next to path ('_districts' suffix).
+    Existing tables are only replaced with overwrite=True.
+    '''
+    def __init__(self, model_reporters, path, batch_size=METRICS_BATCH_SIZE, overwrite=False):
+        self.model_reporters = model_reporters
+        self.batch_size = batch_size
+        root, ext = os.path.splitext(path)
+        self.model_table = TableWriter(path, overwrite)
+        self.district_table = TableWriter(f'{root}_districts{ext}', overwrite)
+        self.model_rows = []
+        self.district_rows = []
+
+    def collect(self, model):
+        self.model_rows.append({'step': model.steps, **{name: getattr(model, attr) for name, attr in self.model_reporters.items()}})
+        self.district_rows.extend({'step': model.steps, **{column: value(dist) for column, value in DISTRICT_COLUMNS.items()}} for dist in model.congdists)
+        if len(self.model_rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.model_table.write(self.model_rows)
+        self.district_table.write(self.district_rows)
+        self.model_rows, self.district_rows = [], []
+
+    def get_model_vars_dataframe(self):
+        '''
+        All collected model rows (one per collect, like mesa.DataCollector).
+        '''
+        self.flush()
+        return self.model_table.read().drop(columns='step', errors='ignore')
+
+    def get_district_vars_dataframe(self):
+        '''
+        All collected district rows (step, district and DISTRICT_COLUMNS).
+        '''
+        self.flush()
+        return self.district_table.read()
+
+    @property
+    def model_vars(self):
+        # Dict of lists (as mesa.DataCollector.model_vars), read back from the table
+        frame = self.get_model_vars_dataframe()
+        return {name: frame[name].tolist() if name in frame else [] for name in self.model_reporters}
+
+    @model_vars.setter
+    def model_vars(self, model_vars):
+        # Rewrite the table with these rows (used when restoring a checkpoint)
+        self.model_table = TableWriter(self.model_table.path, overwrite=True)
+        self.model_rows = [{'step': step, **{name: model_vars[name][step] for name in self.model_reporters}}
+                           for step in range(len(next(iter(model_vars.values()), [])))]
+        self.flush()
+
+    @property
+    def district_vars(self):
+        return self.get_district_vars_dataframe().to_dict('list')
+
+    @district_vars.setter
+    def district_vars(self, district_vars):
+        self.district_table = TableWriter(self.district_table.path, overwrite=True)
+        self.district_rows = pd.DataFrame(district_vars).to_dict('records')
+        self.flush()
@@ -0,0 +1,112 @@
+import numpy as np
+
+'''
+COMPILED PLAN OBJECTIVES
+Scoring functions on NumPy arrays of per-district tallies, combined into one
+objective per control/intervention combination (used by SingleMetricOptimizer).
+'''
+def seat_share_score(reps, dems, party):
+    """
+        • Share of districts won by party ('Republicans' or 'Democrats')
+    """
+    won = reps > dems if party == 'Republicans' else dems > reps
+    return np.count_nonzero(won) / len(reps)
+
+def competitiveness_score(reps, dems):
+    """
+        • 1 - average absolute margin (as share of the two-party vote) across districts
+    """
+    return 1 - (np.abs(dems - reps) / (dems + reps + 1e-9)).sum() / len(reps)
+
+def polsby_popper_score(area, perimeter):
+    """
+        • Average Polsby-Popper score (4 * pi * area / perimeter^2) across districts
+    """
+    return 4 * np.pi * (area / (perimeter * perimeter + 1e-9)).sum() / len(area)
+
+def fair_share_score(reps, dems, dem_share):
+    """
+        • Absolute difference between the Democratic seat share and vote share
+    """
+    return abs(seat_share_score(reps, dems, 'Democrats') - dem_share)
+
+def district_tallies(partition, geometry=False):
+    '''
+    Per-district arrays (NREPS, NDEMS[, area, perimeter]) of a gerrychain partition.
+    '''
+    parts = partition.parts
+    reps, dems = partition['NREPS'], partition['NDEMS']
+    tallies = (np.array([reps[part] for part in parts], dtype=np.float64), np.array([dems[part] for part in parts], dtype=np.float64))
+    if not geometry:
+        return tallies
+    area, perimeter = partition['area'], partition['perimeter']
+    return tallies + (np.array([area[part] for part in parts], dtype=np.float64), np.array([perimeter[part] for part in parts], dtype=np.float64))
+
+class PlanObjective:
+    '''
+    Optimization metric for the party in control, optionally mixed with a reform
+    criterion (intervention) with weight intervention_weight:
+        • Republicans/Democrats: w1 * reform + (1 - w1) * seat share (seat share only without intervention)
+        • Fair: reform score, or |Dem. seat share - Dem. vote share| (minimized) without intervention
+    Gaussian noise with standard deviation sigma is added to every evaluation
+    (except for Fair + Compact). The noise-free scores of the last two partitions are
+    cached: tilted_run alternately scores the proposal and its parent, and run_chain
+    scores the accepted state again.
+    '''
+    def __init__(self, control, intervention='None', intervention_weight=0.0, sigma=0.0, dem_share=0.5):
+        self.control = control
+        self.intervention = intervention
+        self.intervention_weight = intervention_weight
+        self.sigma = sigma
+        self.dem_share = dem_share
+        self.needs_geometry = intervention in ['Compact', 'Both']
+        self.noisy = not (control == 'Fair' and intervention == 'Compact')
+        self.maximize = not (control == 'Fair' and intervention == 'None')
+        # Most recently scored (partition, noise-free score) pairs, newest first
+        self._recent = []
+
+    def __getstate__(self):
+        # Cached partitions (and their graphs) are not sent to chain workers
+        return {**self.__dict__, '_recent': []}
+
+    def reform(self, reps, dems, area, perimeter):
+        if self.intervention == 'Competitive':
+            return competitiveness_score(reps, dems)
+        elif self.intervention == 'Compact':
+            return polsby_popper_score(area, perimeter)
+        return polsby_popper_score(area, perimeter) + competitiveness_score(reps, dems)
+
+    def score(self, reps, dems, area=None, perimeter=None):
+        '''
+        Noise-free objective value of a plan given its per-district arrays.
+        '''
+        if self.control == 'Fair':
+            if self.intervention == 'None':
+                return fair_share_score(reps, dems, self.dem_share)
+            return self.reform(reps, dems, area, perimeter)
+        if self.intervention == 'None':
+            return seat_share_score(reps, dems, self.control)
+        w1, w2 = self.intervention_weight, 1 - self.intervention_weight
+        return w1 * self.reform(reps, dems, area, perimeter) + w2 * seat_share_score(reps, dems, self.control)
+
+    def seats(self, partition):
+        '''
+        Number of seats the party in control wins with partition (0 for Fair).
+        '''
+        if self.control == 'Fair':
+            return 0
+        reps, dems = district_tallies(partition)
+        return int(np.count_nonzero(reps > dems if self.control == 'Republicans' else dems > reps))
+
+    def __call__(self, partition):
+        for k, (recent, score) in enumerate(self._recent):
+            if recent is partition:
+                break
+        else:
+            k, score = None, float(self.score(*district_tallies(partition, geometry=self.needs_geometry)))
+        if k != 0:
+            self._recent = [(partition, score)] + [entry for entry in self._recent if entry[0] is not partition][:1]
+        value = score
+        if self.noisy:
+            value += np.random.normal(0, self.sigma)
+        return value
@@ -0,0 +1,179 @@
+from .sampling import PolygonSampler
+
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import nullcontext
+
+'''
+PROFILING
+Opt-in per-phase instrumentation of GerrySort.step: wall time, call counts and
+(optionally) peak allocated memory per phase, plus hot-path counters (chain proposals,
+rebalancing moves, moves, rejected random_point draws). Per-step values become
+DataCollector columns and report() summarizes the run. Disabled models use
+NullProfiler, whose phases are a shared no-op context.
+'''
+# Instrumented phases (rebalance runs inside setup_gerrychain, mapping_congdist_ids inside redistrict)
+PROFILE_PHASES = ['setup_gerrychain', 'rebalance', 'chain', 'mapping_congdist_ids', 'redistrict', 'update_mapping',
+                  'self_sort', 'update_majorities', 'update_utilities', 'update_statistics']
+PROFILE_COUNTERS = ['proposals', 'rebalance_moves', 'moves', 'random_point_rejections']
+PROFILE_RATES = {'proposals_per_sec': ('proposals', 'chain'), 'moves_per_sec': ('moves', 'self_sort')}
+
+NULL_PHASE = nullcontext()
+
+class NullProfiler:
+    '''
+    Profiler of models without profiling: every call is a no-op.
+    '''
+    enabled = False
+    columns = []
+
+    def phase(self, name):
+        return NULL_PHASE
+
+    def count(self, name, n=1):
+        pass
+
+    def end_step(self, model):
+        pass
+
+    def report(self):
+        return None
+
+class Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.enter(self.name)
+
+    def __exit__(self, *exc):
+        self.profiler.exit(self.name)
+
+class Profiler:
+    '''
+    Records wall time and calls (and, with memory=True, peak memory allocated above the
+    start of the phase, via tracemalloc) of every phase, and counters, per step and for
+    the whole run. end_step writes the step's values to the model attributes named in
+    columns (time_<phase>, memory_<phase>, counters and rates). Tracing started by the
+    profiler is stopped at the end of the run (max_iters steps).
+    '''
+    enabled = True
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.started_tracing = memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        self.columns = [f'time_{name}' for name in PROFILE_PHASES] + PROFILE_COUNTERS + list(PROFILE_RATES)
+        if memory:
+            self.columns += [f'memory_{name}' for name in PROFILE_PHASES]
+        self.calls = defaultdict(int)
+        self.total_time = defaultdict(float)
+        self.max_time = defaultdict(float)
+        self.peak_memory = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.step_time = defaultdict(float)
+        self.step_memory = defaultdict(int)
+        self.step_counters = defaultdict(int)
+        self.steps = 0
+        self.stack = []
+        self.rejections = PolygonSampler.rejections
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def enter(self, name):
+        # Frame: [start time, traced memory at start, peak traced memory seen by nested phases]
+        frame = [time.perf_counter(), 0, 0]
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1][2] = max(self.stack[-1][2], peak)
+            tracemalloc.reset_peak()
+            frame[1] = frame[2] = current
+        self.stack.append(frame)
+
+    def exit(self, name):
+        start, start_memory, nested_peak = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        self.calls[name] += 1
+        self.step_time[name] += elapsed
+        if self.memory:
+            peak = max(tracemalloc.get_traced_memory()[1], nested_peak)
+            self.step_memory[name] = max(self.step_memory[name], peak - start_memory)
+            if self.stack:
+                self.stack[-1][2] = max(self.stack[-1][2], peak)
+
+    def count(self, name, n=1):
+        self.step_counters[name] += n
+
+    def end_step(self, model):
+        '''
+        Close the step: add its values to the run totals and set the model's profile columns.
+        '''
+        self.count('random_point_rejections', PolygonSampler.rejections - self.rejections)
+        self.rejections = PolygonSampler.rejections
+        self.steps += 1
+        for name in PROFILE_PHASES:
+            elapsed = self.step_time[name]
+            self.total_time[name] += elapsed
+            self.max_time[name] = max(self.max_time[name], elapsed)
+            setattr(model, f'time_{name}', elapsed)
+            if self.memory:
+                self.peak_memory[name] = max(self.peak_memory[name], self.step_memory[name])
+                setattr(model, f'memory_{name}', self.step_memory[name])
+        for name in PROFILE_COUNTERS:
+            self.counters[name] += self.step_counters[name]
+            setattr(model, name, self.step_counters[name])
+        for rate, (counter, phase) in PROFILE_RATES.items():
+            setattr(model, rate, self.step_counters[counter] / self.step_time[phase] if self.step_time[phase] > 0 else 0.0)
+        self.step_time.clear()
+        self.step_memory.clear()
+        self.step_counters.clear()
+        # Later models in the process should not be slowed down by tracing
+        if model.steps >= model.max_iters:
+            self.stop_tracing()
+
+    def stop_tracing(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def report(self):
+        '''
+        Run profile as a dict: per phase calls, total/mean/max (per step) time and peak
+        memory (bytes, memory profiling only), counter totals and overall rates.
+        '''
+        phases = {}
+        for name in PROFILE_PHASES:
+            phases[name] = {
+                'calls': self.calls[name],
+                'total_time': self.total_time[name],
+                'mean_time': self.total_time[name] / self.steps if self.steps else 0.0,
+                'max_time': self.max_time[name],
+            }
+            if self.memory:
+                phases[name]['peak_memory'] = self.peak_memory[name]
+        rates = {rate: self.counters[counter] / self.total_time[phase] if self.total_time[phase] > 0 else 0.0
+                 for rate, (counter, phase) in PROFILE_RATES.items()}
+        return {'steps': self.steps, 'phases': phases, 'counters': dict(self.counters), 'rates': rates}
+
+def setup_profiler(model, profile):
+    # None: no profiling, 'time': wall time and counters, 'memory': also peak memory
+    if profile not in [None, 'time', 'memory']:
+        raise ValueError(f'Unknown profile: {profile}')
+    model.profiler = NullProfiler() if profile is None else Profiler(memory=profile == 'memory')
+    for column in model.profiler.columns:
+        setattr(model, column, 0)
+
+def print_profile(report):
+    print(f'[PROFILE] Steps: {report["steps"]}')
+    for name, phase in report['phases'].items():
+        memory = f'\tpeak {phase["peak_memory"] / 2**20:.1f} MiB' if 'peak_memory' in phase else ''
+        print(f'\t{name:<20} {phase["calls"]:>6} calls\t{phase["total_time"]:9.3f} s\t{phase["mean_time"]:9.3f} s/step{memory}')
+    for name, value in report['counters'].items():
+        print(f'\t{name}: {value}')
+    for name, value in report['rates'].items():
+        print(f'\t{name}: {value:.1f}')
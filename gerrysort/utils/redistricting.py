@@ -1,5 +1,11 @@
 from .statistics import *
+from .objectives import PlanObjective
 
+import os
+import random
+import tempfile
+import weakref
+import pandas as pd
 import geopandas as gpd
 from gerrychain import Graph, GeographicPartition
 from gerrychain.optimization import SingleMetricOptimizer
@@ -8,48 +14,122 @@ from gerrychain.tree import bipartition_tree
 from gerrychain.constraints import contiguous
 from gerrychain.updaters import Tally
 from functools import partial
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from scipy.optimize import linear_sum_assignment
 
 def extract_demographics_current_map(model):
-    # Save the current map as a GeoDataFrame (used for gerrychain)
-    model.current_map = gpd.GeoDataFrame([
-        {
-            'geometry': unit.geometry,
-            'NREPS': unit.rep_cnt,
-            'NDEMS': unit.dem_cnt,
-            'TOTPOP': unit.num_people,
-            'VTDID': unit.unique_id,
-            'COUNTYFP': unit.COUNTYFP,
-            'CONGDIST': unit.CONGDIST,
-            'area': unit.geometry.area,
-            'perimeter': unit.geometry.length,
-        }
-        for unit in model.precincts
-    ], crs=model.space.crs)
+    '''
+    Current map as a GeoDataFrame (used for gerrychain and redistricting). Precinct
+    geometry (repaired and projected by prepare_state), ids, area and perimeter never
+    change, so the table is built once and only the counts and districts are updated.
+    '''
+    if getattr(model, 'current_map', None) is None:
+        geometry = gpd.GeoSeries([unit.geometry for unit in model.precincts], crs=model.space.crs)
+        model.current_map = gpd.GeoDataFrame({
+            'geometry': geometry,
+            'NREPS': 0,
+            'NDEMS': 0,
+            'TOTPOP': 0,
+            'VTDID': [unit.unique_id for unit in model.precincts],
+            'COUNTYFP': [unit.COUNTYFP for unit in model.precincts],
+            'CONGDIST': '',
+            'area': geometry.area,
+            'perimeter': geometry.length,
+        }, crs=model.space.crs)
+    current_map = model.current_map
+    if 'NEW_CONGDIST' in current_map:
+        del current_map['NEW_CONGDIST']
+    current_map['NREPS'] = [unit.rep_cnt for unit in model.precincts]
+    current_map['NDEMS'] = [unit.dem_cnt for unit in model.precincts]
+    current_map['TOTPOP'] = [unit.num_people for unit in model.precincts]
+    current_map['CONGDIST'] = [unit.CONGDIST for unit in model.precincts]
+
+GRAPH_CACHE_DIR = os.path.join('data', 'cache')
+
+def setup_graph(model, cache_dir=GRAPH_CACHE_DIR):
+    '''
+    Build the precinct dual graph once per model (node i is model.precincts[i]).
+
+    Adjacency and shared perimeters never change during a run, so the graph is
+    persisted to cache_dir keyed by state and data fingerprint and reused by later runs.
+    The cache file is written to a temporary file and moved into place (parallel runs
+    share it), and a cache that cannot be read is rebuilt.
+    '''
+    precinct_map = model.data[['VTDID', 'COUNTYFP', 'geometry']].reset_index(drop=True)
+    filename = os.path.join(cache_dir, f'{model.state}_{model.prepared["fingerprint"]}_graph.json')
+    model.graph = None
+    if os.path.exists(filename):
+        try:
+            model.graph = Graph.from_json(filename)
+            if model.print: print(f'Loaded precinct graph from {filename}')
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if model.print: print(f'Could not load cached precinct graph ({e}), rebuilding it')
+    if model.graph is None:
+        model.graph = Graph.from_geodataframe(precinct_map)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as f:
+                temp_file = f.name
+            try:
+                model.graph.to_json(temp_file)
+                os.replace(temp_file, filename)
+            finally:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+        except OSError as e:
+            if model.print: print(f'Could not cache precinct graph: {e}')
+    update_graph(model)
+    setup_boundary_table(model)
+
+def setup_boundary_table(model):
+    '''
+    Precinct areas, state-exterior boundary lengths and shared boundary lengths of
+    adjacent precinct pairs (from the precinct graph), used to sum district areas and
+    perimeters over an assignment without dissolving geometries.
+    '''
+    nodes = range(len(model.precincts))
+    model.precinct_area = np.array([model.graph.nodes[node]['area'] for node in nodes], dtype=np.float64)
+    model.precinct_exterior = np.array([model.graph.nodes[node].get('boundary_perim', 0.0) for node in nodes], dtype=np.float64)
+    edges = [(u, v, data['shared_perim']) for u, v, data in model.graph.edges(data=True)]
+    model.boundary_pairs = np.array([(u, v) for u, v, _ in edges], dtype=np.int32).reshape(-1, 2)
+    model.boundary_lengths = np.array([length for _, _, length in edges], dtype=np.float64)
+
+def update_graph(model):
+    '''
+    Copy the current precinct tallies and district assignment onto the graph nodes.
+    '''
+    for node, precinct in enumerate(model.precincts):
+        attributes = model.graph.nodes[node]
+        attributes['NREPS'] = precinct.rep_cnt
+        attributes['NDEMS'] = precinct.dem_cnt
+        attributes['TOTPOP'] = precinct.num_people
+        attributes['CONGDIST'] = precinct.CONGDIST
 
 def setup_gerrychain(model):
-    # Extract demographics from current map
+    # Extract demographics from current map (geometry is set up once)
     extract_demographics_current_map(model)
 
-    # Check if current map is in the correct crs
-    if model.current_map.crs != model.space.crs:
-        model.current_map = model.current_map.to_crs(model.space.crs)
-    # Fix invalid geometries
-    if len(model.current_map[model.current_map.is_valid == False]) > 0:
-        model.current_map['geometry'] = model.current_map['geometry'].buffer(0)
-
-    # Setup gerrychain
-    model.graph = Graph.from_geodataframe(model.current_map) 
-    updaters = {
-        'TOTPOP': Tally('TOTPOP'),
-        'NREPS': Tally('NREPS'),
-        'NDEMS': Tally('NDEMS'),
-    }
+    # Setup gerrychain (the precinct graph is built once, only its node data changes)
+    update_graph(model)
+    # Warm start: repair the balance of the current (previous best) plan
+    rebalanced = None
+    if model.max_popdev >= model.epsilon and model.chain_start == 'warm':
+        with model.profiler.phase('rebalance'):
+            rebalanced = rebalance_assignment(model)
     if model.max_popdev < model.epsilon:
         if model.print: print('Starting from current assignment')
         initial_partition = GeographicPartition(
             model.graph,
             assignment='CONGDIST',
-            updaters=updaters
+            updaters=plan_updaters()
+        )
+    elif rebalanced is not None:
+        if model.print: print('Starting from rebalanced current assignment')
+        initial_partition = GeographicPartition(
+            model.graph,
+            assignment=rebalanced,
+            updaters=plan_updaters()
         )
     else:
         if model.print: print('Starting from random assignment')
@@ -58,100 +138,242 @@ def setup_gerrychain(model):
             n_parts=len(model.current_map['CONGDIST'].unique()),
             epsilon=model.epsilon,
             pop_col="TOTPOP",
-            updaters=updaters
+            updaters=plan_updaters()
         )
     model.ideal_population = sum(initial_partition['TOTPOP'].values()) / len(initial_partition)
     if model.print: print("Ideal population:", model.ideal_population)
+    # Optimization metric for the party in control (and the reform intervention)
+    model.opt_metric = PlanObjective(
+        model.control,
+        intervention=model.intervention,
+        intervention_weight=model.intervention_weight,
+        sigma=model.sigma,
+        dem_share=model.ndems / (model.ndems + model.nreps)
+    )
+    # Chain settings shared by every (parallel) chain
+    model.chain_config = {
+        'pop_target': model.ideal_population,
+        'epsilon': model.epsilon,
+        'contiguity': model.state not in ['WI', 'MI'],
+        'objective': model.opt_metric,
+        'ensemble_size': model.ensemble_size,
+    }
+    model.initial_assignment = initial_partition.assignment.to_dict()
+    model.map_generator = create_optimizer(initial_partition, model.chain_config)
+
+def stays_connected(neighbors, labels, node):
+    # Whether the district of node stays connected around node when node leaves it
+    district = labels[node]
+    starts = [other for other in neighbors[node] if labels[other] == district]
+    if len(starts) <= 1:
+        return True
+    seen, stack, remaining = {node, starts[0]}, [starts[0]], set(starts[1:])
+    while stack and remaining:
+        for other in neighbors[stack.pop()]:
+            if other not in seen and labels[other] == district:
+                seen.add(other)
+                remaining.discard(other)
+                stack.append(other)
+    return not remaining
+
+def rebalance_assignment(model, max_moves=None):
+    '''
+    Repair the population balance of the current plan with boundary-precinct moves and
+    return it as a node -> CONGDIST assignment (None if it cannot be brought within
+    epsilon of the ideal population in max_moves moves, default: number of precincts).
+
+    • Every move hands a boundary precinct to an adjacent district, picking the move that
+      most reduces the sum of squared population deviations (so moves never cycle)
+    • A move must leave the donor district non-empty and connected around the precinct
+    '''
+    n = len(model.precincts)
+    congdist_ids = [congdist.unique_id for congdist in model.congdists]
+    labels = model.space.precinct_congdist_idx.astype(np.int64)
+    population = np.array([precinct.num_people for precinct in model.precincts], dtype=np.int64)
+    neighbors = [list(model.graph.neighbors(node)) for node in range(n)]
+    district_pop = np.bincount(labels, weights=population, minlength=len(congdist_ids))
+    district_size = np.bincount(labels, minlength=len(congdist_ids))
+    ideal = population.sum() / len(congdist_ids)
+    # Boundary moves in both directions of every precinct adjacency (node -> district of other)
+    nodes = np.concatenate([model.boundary_pairs[:, 0], model.boundary_pairs[:, 1]])
+    others = np.concatenate([model.boundary_pairs[:, 1], model.boundary_pairs[:, 0]])
+    moves = 0
+    while np.abs(district_pop - ideal).max() >= model.epsilon * ideal:
+        if moves >= (max_moves or n):
+            return None
+        donor, target = labels[nodes], labels[others]
+        weight = population[nodes]
+        # Change of the sum of squared deviations is -2w(excess[donor] - excess[target] - w)
+        gain = weight * (district_pop[donor] - district_pop[target] - weight)
+        candidates = np.flatnonzero((donor != target) & (gain > 0) & (district_size[donor] > 1))
+        for k in candidates[np.argsort(-gain[candidates], kind='stable')]:
+            if stays_connected(neighbors, labels, nodes[k]):
+                break
+        else:
+            return None
+        node, d, t = nodes[k], donor[k], target[k]
+        labels[node] = t
+        district_pop[d] -= population[node]
+        district_pop[t] += population[node]
+        district_size[d] -= 1
+        district_size[t] += 1
+        moves += 1
+    model.profiler.count('rebalance_moves', moves)
+    if model.print: print(f'Rebalanced the current assignment with {moves} precinct moves')
+    return {node: congdist_ids[label] for node, label in enumerate(labels)}
+
+def plan_updaters():
+    return {
+        'TOTPOP': Tally('TOTPOP'),
+        'NREPS': Tally('NREPS'),
+        'NDEMS': Tally('NDEMS'),
+    }
+
+def create_optimizer(initial_partition, config):
+    '''
+    SingleMetricOptimizer running ReCom proposals from initial_partition.
+    '''
     proposal = partial(
         recom,
         pop_col='TOTPOP',
-        pop_target=model.ideal_population,
-        epsilon=model.epsilon,
+        pop_target=config['pop_target'],
+        epsilon=config['epsilon'],
         node_repeats=1,
         method = partial(
             bipartition_tree,
             allow_pair_reselection=True
         )
     )
-    state_constraints = [] if model.state in ['WI', 'MI'] else [contiguous]
-    if model.control == "Republicans":
-        if model.intervention == 'Competitive':
-            w1, w2 = model.intervention_weight, 1 - model.intervention_weight
-            model.opt_metric = lambda x: w1 * (1 - (sum([abs(x["NDEMS"][node] - x["NREPS"][node]) / (x["NDEMS"][node] + x["NREPS"][node] + 1e-9) for node in x.parts]) / len(x))) + w2 * (sum([1 for node in x.parts if x["NREPS"][node] > x["NDEMS"][node]]) / len(x)) + np.random.normal(0,  model.sigma)
-        elif model.intervention == 'Compact':
-            w1, w2 = model.intervention_weight, 1 - model.intervention_weight
-            model.opt_metric = lambda x: w1 * (sum([4 * np.pi * (x["area"][node] / (x["perimeter"][node] ** 2 + 1e-9)) for node in x.parts]) / len(x)) + w2 * (sum([1 for node in x.parts if x["NREPS"][node] > x["NDEMS"][node]]) / len(x)) + np.random.normal(0,  model.sigma)
-        elif model.intervention == 'Both':
-            w1, w2 = model.intervention_weight, 1 - model.intervention_weight
-            model.opt_metric = lambda x: w1 * ((sum([4 * np.pi * (x["area"][node] / (x["perimeter"][node] ** 2 + 1e-9)) for node in x.parts]) / len(x)) + (1 - (sum([abs(x["NDEMS"][node] - x["NREPS"][node]) / (x["NDEMS"][node] + x["NREPS"][node] + 1e-9) for node in x.parts]) / len(x)))) + w2 * (sum([1 for node in x.parts if x["NREPS"][node] > x["NDEMS"][node]]) / len(x)) + np.random.normal(0,  model.sigma)
-
-        else: # Partisan Gerrymandering
-            model.opt_metric = lambda x: (sum([1 for node in x.parts if x["NREPS"][node] > x["NDEMS"][node]]) / len(x)) + np.random.normal(0,  model.sigma)
-
-    elif model.control == "Democrats":
-        if model.intervention == 'Competitive':
-            w1, w2 = model.intervention_weight, 1 - model.intervention_weight
-            model.opt_metric = lambda x: w1 * (1 - (sum([abs(x["NDEMS"][node] - x["NREPS"][node]) / (x["NDEMS"][node] + x["NREPS"][node] + 1e-9) for node in x.parts]) / len(x))) + w2 * (sum([1 for node in x.parts if x["NDEMS"][node] > x["NREPS"][node]]) / len(x)) + np.random.normal(0,  model.sigma)
-        elif model.intervention == 'Compact':
-            w1, w2 = model.intervention_weight, 1 - model.intervention_weight
-            model.opt_metric = lambda x: w1 * (sum([4 * np.pi * (x["area"][node] / (x["perimeter"][node] ** 2 + 1e-9)) for node in x.parts]) / len(x)) + w2 * (sum([1 for node in x.parts if x["NDEMS"][node] > x["NREPS"][node]]) / len(x)) + np.random.normal(0,  model.sigma)
-        elif model.intervention == 'Both':
-            w1, w2 = model.intervention_weight, 1 - model.intervention_weight
-            model.opt_metric = lambda x: w1 * ((sum([4 * np.pi * (x["area"][node] / (x["perimeter"][node] ** 2 + 1e-9)) for node in x.parts]) / len(x)) + (1 - (sum([abs(x["NDEMS"][node] - x["NREPS"][node]) / (x["NDEMS"][node] + x["NREPS"][node] + 1e-9) for node in x.parts]) / len(x)))) + w2 * (sum([1 for node in x.parts if x["NDEMS"][node] > x["NREPS"][node]]) / len(x)) + np.random.normal(0,  model.sigma)
-        else: # Partisan Gerrymandering
-            model.opt_metric = lambda x: (sum([1 for node in x.parts if x["NDEMS"][node] > x["NREPS"][node]]) / len(x)) + np.random.normal(0,  model.sigma)
-
-    elif model.control == "Fair":
-        if model.intervention == 'Competitive':
-            model.opt_metric = lambda x: (1 - (sum([abs(x["NDEMS"][node] - x["NREPS"][node]) / (x["NDEMS"][node] + x["NREPS"][node] + 1e-9) for node in x.parts]) / len(x))) + np.random.normal(0, model.sigma)
-            # model.opt_metric = lambda x: sum([1 for node in x.parts if abs(x["NDEMS"][node] - x["NREPS"][node]) / (x["NDEMS"][node] + x["NREPS"][node] + 1e-9) < 0.1]) / len(x) + np.random.normal(0, model.sigma)
-        elif model.intervention == 'Compact':
-            model.opt_metric = lambda x: (sum([4 * np.pi * (x["area"][node] / (x["perimeter"][node] ** 2 + 1e-9)) for node in x.parts]) / len(x))
-        elif model.intervention == 'Both':
-            model.opt_metric = lambda x: ((sum([4 * np.pi * (x["area"][node] / (x["perimeter"][node] ** 2 + 1e-9)) for node in x.parts]) / len(x)) + (1 - (sum([abs(x["NDEMS"][node] - x["NREPS"][node]) / (x["NDEMS"][node] + x["NREPS"][node] + 1e-9) for node in x.parts]) / len(x)))) + np.random.normal(0, model.sigma)
-        else: # Fair Gerrymandering
-            model.opt_metric = lambda x: (abs((sum([1 for node in x.parts if x["NDEMS"][node] > x["NREPS"][node]]) / len(x)) - (model.ndems / (model.ndems + model.nreps)))) + np.random.normal(0,  model.sigma)
-    
-    if model.control == "Fair" and model.intervention == "None":
-        maximize = False # Minimize the difference between the number of Democrats and Republicans
-    else:
-        maximize = True
-
-    model.map_generator = SingleMetricOptimizer(
+    state_constraints = [contiguous] if config['contiguity'] else []
+    return SingleMetricOptimizer(
         initial_state=initial_partition,
         proposal=proposal,
         constraints=state_constraints,
-        optimization_metric=model.opt_metric,
-        maximize=maximize,
+        # Fair control without intervention minimizes the difference between seat and vote share
+        optimization_metric=config['objective'],
+        maximize=config['objective'].maximize,
     )
 
-def find_best_plan(model):
-    setup_gerrychain(model)
-    best_score = -1
-    best_step = 0 # Keep track at which step the best plan was found
-    change_cnt = 0
-    for i, part in enumerate(model.map_generator.tilted_run(model.ensemble_size, 0.1, with_progress_bar=model.print)):
+def run_chain(optimizer, config, verbose=False, control=None):
+    '''
+    Run one tilted chain and return its best score, predicted seats, best step,
+    number of improvements, number of proposals, the best assignment (node -> district)
+    and the optimizer's score of that assignment (best_score).
+    '''
+    objective = config['objective']
+    result = {'score': -1, 'predicted_seats': None, 'step': 0, 'changes': 0}
+    for i, part in enumerate(optimizer.tilted_run(config['ensemble_size'], 0.1, with_progress_bar=verbose)):
     # ALTERNATIVE GENERATION ALGORITHMS
-    # for i, part in enumerate(model.map_generator.short_bursts(10, 100, with_progress_bar=True)):
-    # for i, part in enumerate(model.map_generator.simulated_annealing(model.ensemble_size, model.map_generator.jumpcycle_beta_function(200, 800), beta_magnitude=1, with_progress_bar=True)):
-        new_score = model.opt_metric(part)
-        if new_score > best_score:
-            best_score = new_score
-            if model.control == "Fair":
-                model.predicted_seats = 0
-            elif model.control == "Republicans":
-                model.predicted_seats = sum([1 for node in part.parts if part["NREPS"][node] > part["NDEMS"][node]])
-            elif model.control == "Democrats":
-                model.predicted_seats = sum([1 for node in part.parts if part["NDEMS"][node] > part["NREPS"][node]])
-            if model.print: print(f'Found new best plan at step {i} with a score of {best_score} and {model.predicted_seats} seats in favor of {model.control}')
-            best_step = i
-            change_cnt += 1
-    if model.print: print(f'The {model.control} have found the best plan at step {best_step} with a score of {model.map_score} after {change_cnt} changes')
-    model.current_map['NEW_CONGDIST'] = model.map_generator.best_part.assignment
+    # for i, part in enumerate(optimizer.short_bursts(10, 100, with_progress_bar=True)):
+    # for i, part in enumerate(optimizer.simulated_annealing(config['ensemble_size'], optimizer.jumpcycle_beta_function(200, 800), beta_magnitude=1, with_progress_bar=True)):
+        new_score = objective(part)
+        if new_score > result['score']:
+            result['score'] = new_score
+            result['predicted_seats'] = objective.seats(part)
+            if verbose: print(f'Found new best plan at step {i} with a score of {new_score} and {result["predicted_seats"]} seats in favor of {control}')
+            result['step'] = i
+            result['changes'] += 1
+    result['proposals'] = config['ensemble_size']
+    result['assignment'] = optimizer.best_part.assignment.to_dict()
+    result['best_score'] = optimizer.best_score
+    return result
+
+# Precinct graph of a chain worker process (sent once, when the worker starts)
+WORKER_GRAPH = None
+
+def init_chain_worker(graph):
+    global WORKER_GRAPH
+    WORKER_GRAPH = graph
+
+def run_seeded_chain(assignment, counts, config, seed):
+    '''
+    Run one chain in a worker process from the shared initial assignment (district per
+    node) with its own seed, after copying the step's precinct counts (NREPS, NDEMS and
+    TOTPOP per node) onto the worker's graph.
+    '''
+    for node, (reps, dems, people) in enumerate(counts.tolist()):
+        attributes = WORKER_GRAPH.nodes[node]
+        attributes['NREPS'], attributes['NDEMS'], attributes['TOTPOP'] = reps, dems, people
+    random.seed(seed)
+    np.random.seed(seed)
+    initial_partition = GeographicPartition(WORKER_GRAPH, assignment=dict(enumerate(assignment)), updaters=plan_updaters())
+    return run_chain(create_optimizer(initial_partition, config), config)
+
+def chain_pool(model):
+    '''
+    Process pool of the model's parallel chains, started once per model: every worker
+    gets the precinct graph when it starts. Shut down at the end of the run (or when the
+    model is garbage collected).
+    '''
+    if getattr(model, 'chain_pool', None) is None:
+        n_workers = model.n_workers or min(model.n_chains, os.cpu_count() or 1)
+        model.chain_pool = ProcessPoolExecutor(max_workers=n_workers, initializer=init_chain_worker, initargs=(model.graph,))
+        weakref.finalize(model, model.chain_pool.shutdown, wait=False)
+    return model.chain_pool
+
+def close_chain_pool(model):
+    if getattr(model, 'chain_pool', None) is not None:
+        model.chain_pool.shutdown()
+        model.chain_pool = None
+
+def run_parallel_chains(model):
+    '''
+    Run model.n_chains independent chains over the model's process pool and return their
+    results (in chain order); only the initial assignment and precinct counts are sent
+    per step. Chain seeds are drawn from the model's random state, so a seeded run is
+    reproducible regardless of the number of workers.
+    '''
+    base_seed = random.getrandbits(32)
+    seeds = [(base_seed + k) % 2**32 for k in range(model.n_chains)]
+    assignment = [model.initial_assignment[node] for node in range(len(model.precincts))]
+    counts = np.array([(precinct.rep_cnt, precinct.dem_cnt, precinct.num_people) for precinct in model.precincts], dtype=np.int64)
+    pool = chain_pool(model)
+    futures = [pool.submit(run_seeded_chain, assignment, counts, model.chain_config, seed) for seed in seeds]
+    return [future.result() for future in futures]
+
+def find_best_plan(model):
+    with model.profiler.phase('setup_gerrychain'):
+        setup_gerrychain(model)
+    if model.n_chains > 1:
+        with model.profiler.phase('chain'):
+            results = run_parallel_chains(model)
+        model.profiler.count('proposals', sum(result['proposals'] for result in results))
+        # Best plan across chains by the score of the returned plan, in the objective's
+        # direction (ties go to the lowest chain)
+        select = max if model.chain_config['objective'].maximize else min
+        best = select(range(len(results)), key=lambda k: results[k]['best_score'])
+        result = results[best]
+        if model.print: print(f'Ran {len(results)} chains, chain {best} found the best plan')
+    else:
+        with model.profiler.phase('chain'):
+            result = run_chain(model.map_generator, model.chain_config, verbose=model.print, control=model.control)
+        model.profiler.count('proposals', result['proposals'])
+    best_score = result['score']
+    if result['predicted_seats'] is not None:
+        model.predicted_seats = result['predicted_seats']
+    if model.print: print(f'The {model.control} have found the best plan at step {result["step"]} with a score of {best_score} after {result["changes"]} changes')
+    model.current_map['NEW_CONGDIST'] = pd.Series(result['assignment'])
     model.current_map['NEW_CONGDIST'] = model.current_map['NEW_CONGDIST'].apply(lambda x: str(int(x) + 1).zfill(2))
     model.map_score = best_score
 
-def mapping_congdist_ids(model):
+def mapping_congdist_ids(model, method='assignment', weight='area'):
+    '''
+    Map each NEW_CONGDIST label to the CONGDIST it overlaps most (one-to-one).
+
+    • 'assignment': optimal matching (scipy's linear_sum_assignment) on the precinct-level
+      contingency table of CONGDIST vs NEW_CONGDIST, weighted by precinct weight ('area'
+      or 'TOTPOP'); no geometry operations
+    • 'overlap': greedy matching on the intersection areas of the dissolved districts
+    '''
+    if method == 'overlap':
+        return mapping_congdist_ids_overlap(model)
+    # Total weight of the precincts in each (new, old) district pair
+    overlap = pd.crosstab(model.current_map['NEW_CONGDIST'], model.current_map['CONGDIST'],
+                          values=model.current_map[weight], aggfunc='sum').fillna(0)
+    new_idx, old_idx = linear_sum_assignment(overlap.to_numpy(), maximize=True)
+    return {overlap.index[i]: overlap.columns[j] for i, j in zip(new_idx, old_idx)}
+
+def mapping_congdist_ids_overlap(model):
     # Dissolve geometries by CONGDIST and NEW_CONGDIST, converting to EPSG:4326 in one step
     dissolved_congdist = model.current_map.to_crs(model.space.crs).dissolve(by='CONGDIST', aggfunc='sum')
     dissolved_new_congdist = model.current_map.to_crs(model.space.crs).dissolve(by='NEW_CONGDIST', aggfunc='sum')
@@ -185,7 +407,8 @@ def redistrict(model):
     initial_congdists = model.current_map.set_index('VTDID')['CONGDIST'].copy()
 
     # Generate the mapping for new congdists
-    new_congdists_mapping = mapping_congdist_ids(model)
+    with model.profiler.phase('mapping_congdist_ids'):
+        new_congdists_mapping = mapping_congdist_ids(model)
 
     # Update model.current_map['CONGDIST'] with the new mapping
     model.current_map['NEW_CONGDIST'] = model.current_map['NEW_CONGDIST'].map(new_congdists_mapping)
@@ -203,11 +426,10 @@ def redistrict(model):
     # Set the new congdist assignments
     model.current_map['CONGDIST'] = model.current_map['NEW_CONGDIST']
 
-    # Update the geometry of each district
-    new_map = model.current_map.dissolve(by='CONGDIST', aggfunc='sum').reset_index().to_crs(model.space.crs)
-    new_geometries = new_map.set_index('CONGDIST')['geometry'].to_dict()
+    # District geometries are re-dissolved lazily from their precincts (area and
+    # perimeter come from the precinct boundary table, see district_area_perimeter)
     for congdist in model.congdists:
-        congdist.geometry = new_geometries[congdist.unique_id]
+        congdist.invalidate_geometry()
 
     return reassigned_precincts
 
@@ -230,9 +452,14 @@ def update_mapping(model, reassigned_precincts):
             setattr(new_congdist, attr, getattr(new_congdist, attr) + value)
 
         # Update person congdist_id attribute
-        for person_id in precinct.reps + precinct.dems:
+        model.space.precinct_congdist_idx[model.space.precinct_index[precinct_id]] = model.space.congdist_index[congdist_id]
+        if model.population_mode == 'arrays':
+            continue
+        for person_id in chain(precinct.reps, precinct.dems):
             person = model.space.get_person_by_id(person_id)
             person.congdist_id = congdist_id
+    if model.population_mode == 'arrays':
+        model.population.congdist[:] = model.space.precinct_congdist_idx[model.population.precinct]
 
 def save_current_map(model, filename):
     """
@@ -0,0 +1,179 @@
+import numpy as np
+import random
+import shapely
+from shapely.geometry import Point
+
+class AliasTable:
+    '''
+    Walker alias table (Vose's construction) for O(1) draws from a fixed discrete
+    distribution over items. NaN weights count as zero; if all weights are zero the
+    items are drawn uniformly.
+    '''
+    def __init__(self, items, weights):
+        weights = np.nan_to_num(np.asarray(weights, dtype=np.float64), nan=0.0)
+        n = len(weights)
+        if weights.sum() <= 0:
+            weights = np.ones(n)
+        scaled = weights * n / weights.sum()
+        prob = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1]
+        large = [i for i in range(n) if scaled[i] >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1
+            (small if scaled[l] < 1 else large).append(l)
+        self.n = n
+        self.items = np.asarray(items)
+        self.prob = prob
+        self.alias = alias
+        # Plain lists for fast scalar draws
+        self._items = self.items.tolist()
+        self._prob = prob.tolist()
+        self._alias_items = self.items[alias].tolist()
+
+    def draw(self):
+        '''
+        Draw one item (uses the random module, like the rest of the model).
+        '''
+        u = random.random() * self.n
+        i = int(u)
+        return self._items[i] if u - i < self._prob[i] else self._alias_items[i]
+
+    def draw_many(self, k):
+        '''
+        Draw k items at once as a NumPy array (uses np.random).
+        '''
+        i = np.random.randint(0, self.n, size=k)
+        keep = np.random.random(k) < self.prob[i]
+        return np.where(keep, self.items[i], self.items[self.alias[i]])
+
+class IndexedSet:
+    '''
+    Set with O(1) add, discard, membership and uniform random pick (index-swap list
+    plus a position map).
+    '''
+    def __init__(self, items=()):
+        self.items = []
+        self.position = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.position
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def add(self, item):
+        if item not in self.position:
+            self.position[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        i = self.position.pop(item, None)
+        if i is None:
+            return
+        last = self.items.pop()
+        if last != item:
+            self.items[i] = last
+            self.position[last] = i
+
+    def random_choice(self, exclude=None):
+        '''
+        Pick a uniformly random item other than exclude (None if there is none).
+        '''
+        n = len(self.items)
+        k = self.position.get(exclude)
+        if k is not None:
+            n -= 1
+        if n <= 0:
+            return None
+        r = int(random.random() * n)
+        if k is not None and r >= k:
+            r += 1
+        return self.items[r]
+
+class PolygonSampler:
+    '''
+    Uniform point sampler for a (multi)polygon built from a cached Delaunay
+    triangulation of its vertices. Triangles are drawn by area from an alias table
+    and a point is drawn uniformly inside the triangle; only triangles that cross
+    the polygon boundary need a (prepared) containment check, so each draw takes
+    constant expected time regardless of the polygon's shape.
+    '''
+    # Rejected draws of all samplers (only counted on rejection, read by the profiler)
+    rejections = 0
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+        triangles = shapely.get_parts(shapely.delaunay_triangles(geometry))
+        coords = shapely.get_coordinates(triangles).reshape(-1, 4, 2)[:, :3] if len(triangles) else np.empty((0, 3, 2))
+        shapely.prepare(geometry)
+        inside = shapely.contains(geometry, triangles)
+        overlap = inside | (shapely.area(shapely.intersection(triangles, geometry)) > 0)
+        self.origin = coords[overlap, 0]
+        self.edge1 = coords[overlap, 1] - self.origin
+        self.edge2 = coords[overlap, 2] - self.origin
+        self.inside = inside[overlap]
+        self.triangles = AliasTable(np.arange(len(self.origin)), shapely.area(triangles[overlap])) if overlap.any() else None
+        self._origin, self._edge1, self._edge2, self._inside = self.origin.tolist(), self.edge1.tolist(), self.edge2.tolist(), self.inside.tolist()
+
+    def random_point(self):
+        '''
+        Draw one uniform point in the polygon (uses the random module).
+        '''
+        return Point(*self.random_xy())
+
+    def random_xy(self):
+        '''
+        Coordinates (x, y) of one uniform point in the polygon (same draw as random_point).
+        '''
+        if self.triangles is None:
+            point = self._bounding_box_point()
+            return point.x, point.y
+        while True:
+            t = self.triangles.draw()
+            r1, r2 = random.random(), random.random()
+            if r1 + r2 > 1:
+                r1, r2 = 1 - r1, 1 - r2
+            (ox, oy), (ax, ay), (bx, by) = self._origin[t], self._edge1[t], self._edge2[t]
+            x, y = ox + r1 * ax + r2 * bx, oy + r1 * ay + r2 * by
+            if self._inside[t] or shapely.contains_xy(self.geometry, x, y):
+                return x, y
+            PolygonSampler.rejections += 1
+
+    def random_points(self, n):
+        '''
+        Draw n uniform points in the polygon as an (n, 2) array (uses np.random).
+        '''
+        if self.triangles is None:
+            return np.array([[point.x, point.y] for point in (self._bounding_box_point() for _ in range(n))]).reshape(n, 2)
+        points = np.empty((n, 2))
+        todo = np.arange(n)
+        while len(todo):
+            t = self.triangles.draw_many(len(todo))
+            r = np.random.random((len(todo), 2))
+            flip = r.sum(axis=1) > 1
+            r[flip] = 1 - r[flip]
+            candidates = self.origin[t] + r[:, :1] * self.edge1[t] + r[:, 1:] * self.edge2[t]
+            accepted = self.inside[t] | shapely.contains_xy(self.geometry, candidates[:, 0], candidates[:, 1])
+            points[todo[accepted]] = candidates[accepted]
+            todo = todo[~accepted]
+            PolygonSampler.rejections += len(todo)
+        return points
+
+    def _bounding_box_point(self):
+        # Rejection sampling from the bounding box (degenerate triangulations only)
+        min_x, min_y, max_x, max_y = self.geometry.bounds
+        while not self.geometry.contains(
+            random_point := Point(
+                random.uniform(min_x, max_x), random.uniform(min_y, max_y)
+            )):
+            PolygonSampler.rejections += 1
+        return random_point
@@ -0,0 +1,183 @@
+from ..model import GerrySort
+from .initialization import load_prepared_state
+
+import os
+import random
+import numpy as np
+from scipy.stats import qmc
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+'''
+GLOBAL SENSITIVITY ANALYSIS (SOBOL INDICES)
+Saltelli sampling over the GerrySort constructor parameters and first/total-order
+Sobol indices, accumulated block by block so samples never have to be held in memory.
+'''
+# SALib-style problem over the numerical GerrySort parameters (bounds as in the interface)
+PROBLEM = {
+    'names': ['tolerance', 'beta', 'ensemble_size', 'sigma', 'n_moving_options', 'distance_decay', 'capacity_mul', 'intervention_weight'],
+    'bounds': [[0.0, 1.0], [0.0, 100.0], [50, 1000], [0.0, 0.25], [1, 20], [0.0, 1.0], [0.9, 2.0], [0.0, 1.0]],
+}
+INTEGER_PARAMS = ['ensemble_size', 'n_moving_options']
+OUTPUTS = ['efficiency_gap', 'declination', 'rep_congdist_seats', 'avg_county_segregation']
+
+# Prepared state data, loaded once per worker process
+STATE_DATA = {}
+
+def saltelli_blocks(problem, n, seed=None, chunk=1024):
+    '''
+    Yield n Saltelli blocks (first-order/total-order scheme, as SALib's sobol.sample
+    with calc_second_order=False): for each base point the rows A, AB_1, ..., AB_D, B,
+    scaled to the problem bounds. Base points are drawn in chunks from a scrambled Sobol
+    sequence of dimension 2D.
+    '''
+    d = len(problem['names'])
+    lower, upper = np.array(problem['bounds'], dtype=np.float64).T
+    sequence = qmc.Sobol(2 * d, scramble=True, seed=seed)
+    drawn = 0
+    while drawn < n:
+        base = sequence.random(min(chunk, n - drawn))
+        for row in base:
+            a, b = row[:d], row[d:]
+            block = np.tile(a, (d + 2, 1))
+            block[1:d + 1][np.diag_indices(d)] = b
+            block[d + 1] = b
+            yield lower + block * (upper - lower)
+        drawn += len(base)
+
+def sample_params(problem, values):
+    '''
+    GerrySort keyword arguments of one sample row.
+    '''
+    return {name: (int(round(value)) if name in INTEGER_PARAMS else float(value))
+            for name, value in zip(problem['names'], values)}
+
+class SobolAccumulator:
+    '''
+    Streaming estimator of first-order (Saltelli 2010) and total-order (Jansen) Sobol
+    indices from Saltelli blocks. Only running sums are kept, and accumulators of
+    disjoint blocks can be merged (e.g. across MPI ranks). Outputs are centered like
+    SALib's sobol.analyze, so the point estimates equal SALib's on the same samples.
+    '''
+    FIELDS = ['n', 'sum_y', 'n_ab', 'sum_ab', 'sumsq_ab', 'sum_s1', 'sum_diff', 'sum_st']
+
+    def __init__(self, num_vars, outputs=OUTPUTS):
+        self.num_vars = num_vars
+        self.outputs = list(outputs)
+        k = len(self.outputs)
+        self.n = np.zeros(k)               # Blocks per output
+        self.sum_y = np.zeros(k)           # Sum over all rows (for centering)
+        self.n_ab = np.zeros(k)            # A and B rows (for the variance)
+        self.sum_ab = np.zeros(k)
+        self.sumsq_ab = np.zeros(k)
+        self.sum_s1 = np.zeros((k, num_vars))   # Sum of B * (AB_i - A)
+        self.sum_diff = np.zeros((k, num_vars)) # Sum of AB_i - A
+        self.sum_st = np.zeros((k, num_vars))   # Sum of (A - AB_i)^2
+
+    def add(self, block):
+        '''
+        Add the outputs of one block ((D + 2) x outputs; blocks with NaNs are skipped per output).
+        '''
+        block = np.asarray(block, dtype=np.float64)
+        valid = ~np.isnan(block).any(axis=0)
+        if not valid.any():
+            return
+        y = block[:, valid]
+        a, ab, b = y[0], y[1:-1], y[-1]
+        self.n[valid] += 1
+        self.sum_y[valid] += y.sum(axis=0)
+        self.n_ab[valid] += 2
+        self.sum_ab[valid] += a + b
+        self.sumsq_ab[valid] += a * a + b * b
+        self.sum_s1[valid] += (b * (ab - a)).T
+        self.sum_diff[valid] += (ab - a).T
+        self.sum_st[valid] += ((a - ab) ** 2).T
+
+    def merge(self, other):
+        for field in self.FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        return self
+
+    def indices(self):
+        '''
+        {output: {'S1': array, 'ST': array}} over the blocks seen so far.
+        '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            n = self.n[:, None]
+            mean = (self.sum_y / (self.n * (self.num_vars + 2)))[:, None]
+            variance = (self.sumsq_ab / self.n_ab - (self.sum_ab / self.n_ab) ** 2)[:, None]
+            s1 = (self.sum_s1 - mean * self.sum_diff) / n / variance
+            st = 0.5 * self.sum_st / n / variance
+        return {output: {'S1': s1[k], 'ST': st[k]} for k, output in enumerate(self.outputs)}
+
+def run_block(state, block, fixed_params, problem=PROBLEM, outputs=OUTPUTS, seed=None):
+    '''
+    Run GerrySort for every row of a Saltelli block and return the final value of each
+    output ((D + 2) x outputs, NaN for failed runs).
+    '''
+    if state not in STATE_DATA:
+        STATE_DATA[state] = load_prepared_state(state, fixed_params.get('election', 'PRES20'))
+    results = np.full((len(block), len(outputs)), np.nan)
+    for row, values in enumerate(block):
+        if seed is not None:
+            random.seed(seed + row)
+            np.random.seed((seed + row) % 2**32)
+        try:
+            model = GerrySort(state=state, data=STATE_DATA[state], **fixed_params, **sample_params(problem, values))
+            model.run_model()
+        except Exception as e:
+            print(f'Sample failed: {e!r}')
+            continue
+        results[row] = [getattr(model, output) for output in outputs]
+    return results
+
+def mpi_comm():
+    '''
+    MPI communicator when launched under mpirun/mpiexec with more than one rank, else None.
+    '''
+    if not any(var in os.environ for var in ['OMPI_COMM_WORLD_SIZE', 'PMI_SIZE', 'PMIX_RANK', 'MPI_LOCALNRANKS']):
+        return None
+    from mpi4py import MPI
+    return MPI.COMM_WORLD if MPI.COMM_WORLD.Get_size() > 1 else None
+
+def sobol_analysis(state, n, fixed_params=None, problem=PROBLEM, outputs=OUTPUTS, seed=0, workers=None, report_every=None):
+    '''
+    Run n Saltelli blocks (n * (D + 2) model runs) and return the Sobol indices.
+
+    • Under mpirun, block j is run by rank j % size and the accumulators are reduced
+      on rank 0 (other ranks return None)
+    • Otherwise blocks run over a local process pool with a bounded number in flight
+    '''
+    fixed_params = dict(fixed_params or {})
+    accumulator = SobolAccumulator(len(problem['names']), outputs)
+    blocks = saltelli_blocks(problem, n, seed=seed)
+    block_seed = lambda j: seed * 1_000_003 + j * (len(problem['names']) + 2)
+    comm = mpi_comm()
+    if comm is not None:
+        rank, size = comm.Get_rank(), comm.Get_size()
+        for j, block in enumerate(blocks):
+            if j % size == rank:
+                accumulator.add(run_block(state, block, fixed_params, problem, outputs, block_seed(j)))
+        sums = {field: comm.reduce(getattr(accumulator, field), root=0) for field in SobolAccumulator.FIELDS}
+        if rank != 0:
+            return None
+        for field, value in sums.items():
+            setattr(accumulator, field, value)
+        return accumulator.indices()
+
+    workers = workers or os.cpu_count() or 1
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for j, block in enumerate(blocks):
+            pending.add(pool.submit(run_block, state, block, fixed_params, problem, outputs, block_seed(j)))
+            # Keep at most two blocks per worker in flight
+            while len(pending) >= 2 * workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    accumulator.add(future.result())
+                    done += 1
+                    if report_every and done % report_every == 0:
+                        print(f'{done}/{n} blocks done')
+        for future in pending:
+            accumulator.add(future.result())
+    return accumulator.indices()
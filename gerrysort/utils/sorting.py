@@ -0,0 +1,163 @@
+from .utility import BLUE, RED, location_utilities
+from .distance import distance_meters, discounted_utilities
+
+import numpy as np
+from shapely.geometry import Point
+
+'''
+BATCHED SORTING (sorting_mode='batched')
+All unhappy voters sort at once instead of one after another (the default,
+sorting_mode='sequential'):
+
+• Candidates: n_moving_options (county, precinct) draws per voter from the counties
+  below capacity at the start of the sort (sequential sorting sees capacities change
+  as earlier voters move)
+• Choice: row-wise softmax over beta * delta_U of staying put and the candidates
+  (the same probabilities as PersonAgent.sort, computed stably)
+• Moves: applied in bulk. Capacity conflicts are resolved in rounds: a county admits
+  arrivals up to its free capacity, those with the largest utility gain first (ties:
+  lowest voter index), and the room freed by admitted departures is filled in the next
+  round; voters who are never admitted stay put
+'''
+def county_sampler_arrays(space, counties):
+    '''
+    The per-county precinct alias tables concatenated into flat arrays (built once).
+    '''
+    if getattr(space, 'sampler_arrays', None) is None:
+        samplers = [space.county_precinct_samplers[county.unique_id] for county in counties]
+        sizes = np.array([sampler.n for sampler in samplers], dtype=np.int64)
+        space.sampler_arrays = {
+            'offset': np.concatenate([[0], np.cumsum(sizes)[:-1]]),
+            'size': sizes,
+            'prob': np.concatenate([sampler.prob for sampler in samplers]),
+            'items': np.concatenate([sampler.items for sampler in samplers]).astype(np.int64),
+            'alias_items': np.concatenate([sampler.items[sampler.alias] for sampler in samplers]).astype(np.int64),
+        }
+    return space.sampler_arrays
+
+def draw_candidates(model, own_county, n_options):
+    '''
+    Candidate counties (uniform over counties below capacity other than the voter's own)
+    and precincts (weighted by TOTPOP) for every voter, as (voters x n_options) index
+    arrays, with a mask of valid candidates.
+    '''
+    space = model.space
+    below = np.array([space.county_index[county_id] for county_id in space.counties_below_capacity], dtype=np.int64)
+    position = np.full(len(model.counties), -1)
+    position[below] = np.arange(len(below))
+    own_position = position[own_county][:, None]
+    n_choices = len(below) - (own_position >= 0)
+    valid = np.broadcast_to(n_choices > 0, (len(own_county), n_options))
+    # Uniform pick among the other counties below capacity (skip the voter's own)
+    r = (np.random.random((len(own_county), n_options)) * np.maximum(n_choices, 1)).astype(np.int64)
+    r += (own_position >= 0) & (r >= own_position)
+    county = below[np.minimum(r, max(len(below) - 1, 0))] if len(below) else np.zeros_like(r)
+    # Alias-table draw of a precinct in each candidate county
+    samplers = county_sampler_arrays(space, model.counties)
+    u = np.random.random(county.shape) * samplers['size'][county]
+    k = samplers['offset'][county] + u.astype(np.int64)
+    keep = (u - np.floor(u)) < samplers['prob'][k]
+    precinct = np.where(keep, samplers['items'][k], samplers['alias_items'][k])
+    return county, precinct, valid
+
+def sample_positions(model, precinct_idx):
+    '''
+    Uniform random point in each of the given precincts, as a (..., 2) array.
+    '''
+    flat = precinct_idx.ravel()
+    positions = np.empty((len(flat), 2))
+    order = np.argsort(flat, kind='stable')
+    precincts, starts = np.unique(flat[order], return_index=True)
+    for j, members in zip(precincts, np.split(order, starts[1:])):
+        positions[members] = model.precincts[j].random_points(len(members))
+    return positions.reshape(precinct_idx.shape + (2,))
+
+def choose_options(beta, delta_U, valid):
+    '''
+    Sample one option per row with probabilities softmax(beta * delta_U) over the valid
+    options (row-wise stable softmax and inverse-CDF draw).
+    '''
+    logits = np.where(valid, beta * delta_U, -np.inf)
+    weights = np.exp(logits - logits.max(axis=1, keepdims=True))
+    cumulative = np.cumsum(weights, axis=1)
+    u = np.random.random(len(delta_U))[:, None] * cumulative[:, -1:]
+    return np.minimum((cumulative <= u).sum(axis=1), delta_U.shape[1] - 1)
+
+def resolve_capacity(model, origin_county, destination_county, gain):
+    '''
+    Movers admitted by the capacity rule, in rounds: per destination county at most its
+    remaining capacity, largest utility gain first (ties: lowest mover index); room freed
+    by the movers admitted in a round is filled in the next.
+    '''
+    n_counties = len(model.counties)
+    room = np.array([max(county.capacity - county.num_people, 0) for county in model.counties])
+    admitted = np.zeros(len(gain), dtype=bool)
+    while True:
+        pending = np.flatnonzero(~admitted)
+        order = pending[np.lexsort((pending, -gain[pending], destination_county[pending]))]
+        sorted_county = destination_county[order]
+        rank = np.arange(len(order)) - np.searchsorted(sorted_county, sorted_county, side='left')
+        new = order[rank < room[sorted_county]]
+        if len(new) == 0:
+            return admitted
+        admitted[new] = True
+        room += np.bincount(origin_county[new], minlength=n_counties) - np.bincount(destination_county[new], minlength=n_counties)
+
+def population_state(model):
+    '''
+    Party, precinct, county, utility, unhappiness and (if tracked) position of every
+    voter as arrays.
+    '''
+    if model.population_mode == 'arrays':
+        population = model.population
+        positions = np.column_stack([population.x, population.y]) if model.space.track_positions else None
+        return population.party, population.precinct, population.county, population.utility, population.is_unhappy, positions
+    space = model.space
+    party = np.array([RED if person.color == 'Red' else BLUE for person in model.population], dtype=np.int8)
+    precinct = np.array([space.precinct_index[person.precinct_id] for person in model.population], dtype=np.int64)
+    utility = np.array([person.utility for person in model.population], dtype=np.float64)
+    is_unhappy = np.array([bool(person.is_unhappy) for person in model.population], dtype=bool)
+    positions = np.array([(person.geometry.x, person.geometry.y) for person in model.population]).reshape(-1, 2) if space.track_positions else None
+    return party, precinct, space.precinct_county_idx[precinct], utility, is_unhappy, positions
+
+def batched_sort(model):
+    '''
+    Sort all unhappy voters at once (see the module notes for how this differs from
+    sequential sorting). Sets model.total_moves.
+    '''
+    party, precinct, county, utility, is_unhappy, positions = population_state(model)
+    voters = np.flatnonzero(is_unhappy)
+    model.total_moves = 0
+    if len(voters) == 0 or model.n_moving_options < 1:
+        return
+    # Candidate locations and their (discounted) utilities
+    candidate_county, candidate_precinct, valid = draw_candidates(model, county[voters], model.n_moving_options)
+    candidate_utility = location_utilities(model, party[voters][:, None], candidate_precinct)
+    candidate_positions = sample_positions(model, candidate_precinct) if model.space.track_positions else None
+    discounted_utility = candidate_utility
+    if model.distance_decay != 0:
+        voter_positions = positions[voters][:, None, :] if positions is not None else None
+        distance = distance_meters(model, precinct[voters][:, None], voter_positions, candidate_precinct, candidate_positions)
+        discounted_utility = discounted_utilities(model, candidate_utility, distance)
+    # Option 0 is staying put (delta_U = 0)
+    delta_U = np.column_stack([np.zeros(len(voters)), discounted_utility - utility[voters][:, None]])
+    chosen = choose_options(model.beta, delta_U, np.column_stack([np.ones(len(voters), dtype=bool), valid]))
+    movers = np.flatnonzero(chosen > 0)
+    option = chosen[movers] - 1
+    admitted = resolve_capacity(model, county[voters[movers]], candidate_county[movers, option], delta_U[movers, chosen[movers]])
+    movers, option = movers[admitted], option[admitted]
+    rows = voters[movers]
+    new_precinct = candidate_precinct[movers, option]
+    new_positions = candidate_positions[movers, option] if candidate_positions is not None else None
+    # Apply the moves in bulk
+    if model.population_mode == 'arrays':
+        model.space.move_person_indices(model.population, rows, new_precinct, new_positions)
+        model.population.utility[rows] = candidate_utility[movers, option]
+    else:
+        for k, i in enumerate(rows.tolist()):
+            person = model.population[i]
+            model.space.remove_person_from_space(person)
+            new_position = Point(new_positions[k]) if new_positions is not None else None
+            model.space.add_person_to_space(person, new_precinct_id=model.space.precinct_ids[new_precinct[k]], new_position=new_position)
+            person.utility = float(candidate_utility[movers[k], option[k]])
+    model.total_moves = len(rows)
@@ -1,7 +1,17 @@
+from .utility import RED
+
 import numpy as np
 from math import pi
 
 def unhappy_happy(model):
+    if model.population_mode == 'arrays':
+        unhappy, is_red = model.population.is_unhappy, model.population.party == RED
+        counts = {"unhappyreps": int(np.count_nonzero(unhappy & is_red)), "unhappydems": int(np.count_nonzero(unhappy & ~is_red)),
+                  "happyreps": int(np.count_nonzero(~unhappy & is_red)), "happydems": int(np.count_nonzero(~unhappy & ~is_red))}
+        counts["unhappy"] = counts["unhappyreps"] + counts["unhappydems"]
+        counts["happy"] = counts["happyreps"] + counts["happydems"]
+        vars(model).update(counts)
+        return
     counts = {"unhappy": 0, "happy": 0, "unhappyreps": 0, "unhappydems": 0, "happyreps": 0, "happydems": 0}
     for agent in model.population:
         key_prefix = "unhappy" if agent.is_unhappy else "happy"
@@ -13,6 +23,9 @@ def unhappy_happy(model):
     vars(model).update(counts)
 
 def avg_utility(model):
+    if model.population_mode == 'arrays':
+        model.avg_utility = np.mean(model.population.utility)
+        return
     model.avg_utility = np.mean([agent.utility for agent in model.population])
 
 def district_seats(model, district_attr, rep_attr, dem_attr, tied_attr):
@@ -59,7 +72,25 @@ def segregation(model):
     model.avg_congdist_segregation = np.mean([calculate_majority_pct(congdist) for congdist in model.congdists])
     model.avg_county_segregation = np.mean([calculate_majority_pct(county) for county in model.counties])
 
+def district_area_perimeter(model):
+    '''
+    Area and perimeter of every district (model.congdists order) summed over the
+    current assignment from the precinct boundary table: the perimeter is the state
+    exterior plus every boundary shared by precincts in different districts.
+    '''
+    assignment = model.space.precinct_congdist_idx
+    n = len(model.congdists)
+    area = np.bincount(assignment, weights=model.precinct_area, minlength=n)
+    perimeter = np.bincount(assignment, weights=model.precinct_exterior, minlength=n)
+    u, v = assignment[model.boundary_pairs[:, 0]], assignment[model.boundary_pairs[:, 1]]
+    cut = u != v
+    perimeter += np.bincount(u[cut], weights=model.boundary_lengths[cut], minlength=n)
+    perimeter += np.bincount(v[cut], weights=model.boundary_lengths[cut], minlength=n)
+    return area, perimeter
+
 def compactness(model, formula='polsby_popper'):
+    for dist, area, perimeter in zip(model.congdists, *district_area_perimeter(model)):
+        dist.area, dist.perimeter = area, perimeter
     score_method = {
         'polsby_popper': lambda dist: dist.polsby_popper(),
         'schwartzberg': lambda dist: dist.schwartzberg()
@@ -116,11 +147,130 @@ def declination(model):
     theta_rep = np.arctan((1 - 2 * np.mean(rep_districts)) / (len(rep_districts) / len(model.congdists)))
     model.declination = 2 * (theta_dem - theta_rep) / pi
 
-def update_statistics(model, statistics=[unhappy_happy, avg_utility, segregation,
-                                         congdist_seats, pop_deviation,
-                                         competitiveness, compactness,
-                                         efficiency_gap, mean_median, declination,
-                                         projected_winner, projected_margin]):
+'''
+ARRAY-BASED STATISTICS ENGINE
+'''
+def population_arrays(model):
+    """
+        • Party (True for Republicans), unhappiness and utility of every voter as arrays
+    """
+    if model.population_mode == 'arrays':
+        population = model.population
+        return population.party == RED, population.is_unhappy, population.utility
+    is_red, is_unhappy, utility = [], [], []
+    for agent in model.population:
+        is_red.append(agent.color == 'Red')
+        is_unhappy.append(agent.is_unhappy)
+        utility.append(agent.utility)
+    return np.array(is_red, dtype=bool), np.array(is_unhappy, dtype=bool), np.array(utility, dtype=np.float64)
+
+def unit_counts(units):
+    """
+        • Republican, Democrat and total counts of geographical units as arrays
+    """
+    reps = np.array([unit.rep_cnt for unit in units], dtype=np.int64)
+    dems = np.array([unit.dem_cnt for unit in units], dtype=np.int64)
+    num_people = np.array([unit.num_people for unit in units], dtype=np.int64)
+    return reps, dems, num_people
+
+def majority_pct(reps, dems, num_people):
+    # Share of the majority party per unit (0.5 for ties), as in segregation
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(reps > dems, reps / num_people, np.where(dems > reps, dems / num_people, 0.5))
+
+def compute_statistics(model, competitive_threshold=0.10, formula='polsby_popper'):
+    """
+        • Computes all outputs of the default update_statistics functions in one pass over
+          per-voter and per-district arrays (same values as those functions)
+        • Also sets the per-district area, perimeter, compactness, competitiveness_score
+          and competitive attributes
+    """
+    # Happiness and utility
+    is_red, is_unhappy, utility = population_arrays(model)
+    model.unhappyreps = int(np.count_nonzero(is_unhappy & is_red))
+    model.unhappydems = int(np.count_nonzero(is_unhappy & ~is_red))
+    model.happyreps = int(np.count_nonzero(~is_unhappy & is_red))
+    model.happydems = int(np.count_nonzero(~is_unhappy & ~is_red))
+    model.unhappy = model.unhappyreps + model.unhappydems
+    model.happy = model.happyreps + model.happydems
+    model.avg_utility = np.mean(utility)
+
+    reps, dems, num_people = unit_counts(model.congdists)
+    red, blue = reps > dems, dems > reps
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rep_pct, dem_pct = reps / num_people, dems / num_people
+
+    # Segregation
+    model.avg_congdist_segregation = np.mean(majority_pct(reps, dems, num_people))
+    model.avg_county_segregation = np.mean(majority_pct(*unit_counts(model.counties)))
+
+    # Seats
+    model.rep_congdist_seats = int(np.count_nonzero(red))
+    model.dem_congdist_seats = int(np.count_nonzero(blue))
+    model.tied_congdist_seats = len(model.congdists) - model.rep_congdist_seats - model.dem_congdist_seats
+
+    # Population deviation
+    ideal_population = model.npop / model.num_congdists
+    pop_devs = np.abs(num_people - ideal_population) / ideal_population
+    model.max_popdev = np.max(pop_devs)
+    model.avg_popdev = np.mean(pop_devs)
+
+    # Competitiveness
+    competitiveness_scores = 1 - (np.abs(dems - reps) / num_people)
+    competitive = competitiveness_scores < competitive_threshold
+    model.min_competitiveness = np.min(competitiveness_scores)
+    model.avg_competitiveness = np.mean(competitiveness_scores)
+    model.max_competitiveness = np.max(competitiveness_scores)
+    model.competitive_seats = int(np.count_nonzero(competitive))
+
+    # Compactness
+    area, perimeter = district_area_perimeter(model)
+    if formula == 'polsby_popper':
+        compactness_scores = 4 * np.pi * (area / (perimeter ** 2 + 1e-9))
+    else:
+        compactness_scores = 1 / (perimeter / (2 * np.pi * np.sqrt(area / np.pi)))
+    model.min_compactness = np.min(compactness_scores)
+    model.avg_compactness = np.mean(compactness_scores)
+    model.max_compactness = np.max(compactness_scores)
+
+    for k, dist in enumerate(model.congdists):
+        dist.area, dist.perimeter = area[k], perimeter[k]
+        dist.compactness = compactness_scores[k]
+        dist.competitiveness_score = competitiveness_scores[k]
+        dist.competitive = bool(competitive[k])
+
+    # Efficiency gap (excess votes above ceil(total / 2) are wasted by the winner)
+    majority_threshold = -(-(reps + dems) // 2)
+    rep_wasted = np.where(red, reps - majority_threshold, np.where(blue, reps, 0))
+    dem_wasted = np.where(blue, dems - majority_threshold, np.where(red, dems, 0))
+    model.efficiency_gap = (int(dem_wasted.sum()) - int(rep_wasted.sum())) / model.npop
+
+    # Mean-median
+    sorted_dem_pct = np.sort(dem_pct)
+    model.mean_median = np.mean(sorted_dem_pct) - np.median(sorted_dem_pct)
+
+    # Declination
+    dem_districts = dem_pct[rep_pct < 0.5]
+    theta_dem = np.arctan((2 * np.mean(dem_districts) - 1) / (len(dem_districts) / len(model.congdists)))
+    rep_districts = dem_pct[rep_pct > 0.5]
+    theta_rep = np.arctan((1 - 2 * np.mean(rep_districts)) / (len(rep_districts) / len(model.congdists)))
+    model.declination = 2 * (theta_dem - theta_rep) / pi
+
+    projected_winner(model)
+    projected_margin(model)
+
+# Reference implementation of compute_statistics (one function per statistic)
+STATISTICS = [unhappy_happy, avg_utility, segregation,
+              congdist_seats, pop_deviation,
+              competitiveness, compactness,
+              efficiency_gap, mean_median, declination,
+              projected_winner, projected_margin]
+
+def update_statistics(model, statistics=None):
+    # All statistics with the array engine, or only the given statistics functions
+    if statistics is None:
+        compute_statistics(model)
+        return
     for stat in statistics:
         stat(model)
 
@@ -0,0 +1,148 @@
+import numpy as np
+import geopandas as gpd
+import shapely
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+'''
+SYNTHETIC STATES
+Generated precinct tables with the columns load_data/prepare_state expect (VTDID,
+county and district ids, TOTPOP, election results and COUNTY_* attributes), so the
+model can run and be benchmarked without data/processed/{state}.geojson.
+'''
+# Precinct, county and district counts of the benchmark scales (medium ~ GA, tx ~ TX)
+SYNTHETIC_SCALES = {
+    'small': {'n_precincts': 144, 'n_counties': 9, 'n_districts': 4},
+    'medium': {'n_precincts': 2700, 'n_counties': 159, 'n_districts': 14},
+    'tx': {'n_precincts': 9000, 'n_counties': 254, 'n_districts': 38},
+}
+RUCA_CATEGORIES = ['urban', 'large_town', 'small_town', 'rural']
+
+def precinct_geometries(n_precincts, layout, width, rng):
+    '''
+    Precinct polygons tiling a width x width square: a grid of (about) n_precincts
+    squares, or the Voronoi cells of n_precincts uniform points.
+    '''
+    if layout == 'grid':
+        nx = max(1, int(round(np.sqrt(n_precincts))))
+        ny = max(1, int(np.ceil(n_precincts / nx)))
+        size = width / max(nx, ny)
+        i, j = np.divmod(np.arange(nx * ny), ny)
+        return shapely.box(i * size, j * size, (i + 1) * size, (j + 1) * size)
+    elif layout == 'voronoi':
+        points = shapely.points(rng.uniform(0, width, size=(n_precincts, 2)))
+        bounds = shapely.box(0, 0, width, width)
+        cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(points), extend_to=bounds))
+        cells = shapely.intersection(cells, bounds)
+        # Voronoi cells are not returned in point order
+        point_idx, cell_idx = shapely.STRtree(cells).query(points, predicate='within')
+        ordered = np.empty(n_precincts, dtype=object)
+        ordered[point_idx] = cells[cell_idx]
+        return ordered
+    raise ValueError(f'Unknown layout: {layout}')
+
+def boustrophedon_order(x, y, n_strips):
+    # Precinct order that runs up and down n_strips vertical strips in turn
+    strips = np.minimum((x * n_strips).astype(np.int64), n_strips - 1)
+    _, strips = np.unique(strips, return_inverse=True)
+    return np.lexsort((np.where(strips % 2 == 0, y, -y), strips))
+
+def equal_weight_chunks(order, weights, n):
+    # Cut the precincts (in order) into n consecutive chunks of about equal total weight
+    cumulative = np.cumsum(weights[order]) - weights[order] / 2
+    labels = np.empty(len(order), dtype=np.int64)
+    labels[order] = np.minimum((cumulative * n / weights.sum()).astype(np.int64), n - 1)
+    return labels
+
+def rook_adjacency(geometry):
+    # Pairs of precincts that share a boundary of positive length
+    left, right = shapely.STRtree(geometry).query(geometry, predicate='intersects')
+    left, right = left[left < right], right[left < right]
+    shared = shapely.length(shapely.intersection(geometry[left], geometry[right])) > 0
+    return left[shared], right[shared]
+
+def make_contiguous(labels, left, right):
+    '''
+    Move precincts that are cut off from the largest connected piece of their unit to a
+    neighbouring unit, until every unit is contiguous.
+    '''
+    labels = labels.copy()
+    n = len(labels)
+    while True:
+        same = labels[left] == labels[right]
+        graph = coo_matrix((np.ones(same.sum()), (left[same], right[same])), shape=(n, n))
+        _, piece = connected_components(graph, directed=False)
+        # Largest piece of every unit
+        sizes = np.bincount(piece)
+        order = np.lexsort((sizes[piece], labels))
+        largest = np.zeros(labels.max() + 1, dtype=np.int64)
+        largest[labels[order]] = piece[order]
+        stray = piece != largest[labels]
+        if not stray.any():
+            return labels
+        # Stray precincts on a unit boundary join the unit across it
+        for a, b in [(left, right), (right, left)]:
+            move = stray[a] & ~same
+            labels[a[move]] = labels[b[move]]
+
+def synthetic_state(n_precincts=2700, n_counties=159, n_districts=14, layout='grid', election='PRES20',
+                    n_cities=5, width=400_000.0, crs=5070, seed=0):
+    '''
+    Synthetic precinct GeoDataFrame of a state.
+
+    • Population is lognormal around a few cities, and Democratic vote share rises with
+      population density (urban counties lean Democratic, rural counties Republican)
+    • Counties (about equal numbers of precincts) and districts (about equal population)
+      are runs of precincts in boustrophedon order, made contiguous
+    • RUCA categories follow county population density
+    '''
+    rng = np.random.default_rng(seed)
+    geometry = precinct_geometries(n_precincts, layout, width, rng)
+    n = len(geometry)
+    centroids = shapely.get_coordinates(shapely.centroid(geometry))
+    x, y = centroids[:, 0] / width, centroids[:, 1] / width
+    area = shapely.area(geometry) / (width * width)
+
+    # Population: density bumps around cities
+    cities = rng.uniform(0.1, 0.9, size=(n_cities, 2))
+    distance = np.sqrt((x[:, None] - cities[:, 0]) ** 2 + (y[:, None] - cities[:, 1]) ** 2)
+    density = 1 + 20 * np.exp(-(distance / 0.05) ** 2).sum(axis=1)
+    population = np.maximum(1, np.round(rng.lognormal(np.log(density * area * n * 1500), 0.3)))
+
+    # Votes: two-party Democratic share rises with density (turnout about 45%)
+    dem_share = 1 / (1 + np.exp(-(np.log(density) - 1.0 + rng.normal(0, 0.4, n))))
+    votes = np.round(population * rng.uniform(0.35, 0.55, n))
+    dem_votes = np.round(votes * dem_share)
+    rep_votes = votes - dem_votes
+
+    # Counties (equal numbers of precincts) and districts (equal population): consecutive
+    # chunks of the precincts in boustrophedon order over strips about three precincts wide
+    order = boustrophedon_order(x, y, max(1, int(round(np.sqrt(n) / 3))))
+    left, right = rook_adjacency(geometry)
+    county = make_contiguous(equal_weight_chunks(order, np.ones(n), n_counties), left, right)
+    district = make_contiguous(equal_weight_chunks(order, population, n_districts), left, right)
+
+    data = gpd.GeoDataFrame({
+        'VTDID': [f'{k:06d}' for k in range(n)],
+        'COUNTY_NAME': [f'County {c:03d}' for c in county],
+        'COUNTYFP': [f'{c + 1:03d}' for c in county],
+        'CONGDIST': [f'{d + 1:02d}' for d in district],
+        'SENDIST': [f'{d + 1:02d}' for d in district],
+        'LEGDIST': [f'{d + 1:02d}' for d in district],
+        'TOTPOP': population,
+        f'{election}R': rep_votes,
+        f'{election}D': dem_votes,
+        f'{election}TOT': votes,
+    }, geometry=geometry, crs=crs)
+
+    # County attributes (totals, households, housing and RUCA category by density rank)
+    county_pop = data.groupby('COUNTYFP')['TOTPOP'].transform('sum')
+    county_density = county_pop / data.geometry.area.groupby(data['COUNTYFP']).transform('sum')
+    density_rank = county_density.rank(method='dense', pct=True, ascending=False)
+    data['COUNTY_TOTPOP'] = county_pop
+    data['COUNTY_TOTPOP_SHARE'] = county_pop / population.sum()
+    data['COUNTY_HOUSEHOLDS'] = np.round(county_pop / 2.5)
+    data['COUNTY_HOUSING_UNITS'] = np.round(county_pop / 2.3)
+    data['COUNTY_CAPACITY'] = np.round(data['COUNTY_HOUSING_UNITS'] * 2.7)
+    data['COUNTY_RUCACAT'] = [RUCA_CATEGORIES[min(int(rank * 4 - 1e-9), 3)] for rank in density_rank]
+    return data
@@ -0,0 +1,55 @@
+import numpy as np
+
+# Party and majority codes (majority codes use GREY for ties)
+BLUE, RED, GREY = 0, 1, 2
+COLOR_CODES = {'Blue': BLUE, 'Red': RED, 'Grey': GREY}
+
+# County urbanicity (COUNTY_RUCACAT) codes, any other category maps to OTHER_RUCA
+RUCA_CODES = {'urban': 0, 'large_town': 1, 'small_town': 2, 'rural': 3}
+OTHER_RUCA = 4
+
+# Urbanicity match X3 per (party, RUCA code): Dems prefer urban, Reps prefer rural
+URBANICITY_TABLE = np.array([
+    # urban, large_town, small_town, rural, other
+    [1.0,  1.0,  0.5,  0.25, 0.25], # Blue
+    [0.25, 0.5,  1.0,  1.0,  0.25], # Red
+])
+URBANICITY = {(color, ruca): float(URBANICITY_TABLE[COLOR_CODES[color], code])
+              for color in ['Blue', 'Red'] for ruca, code in RUCA_CODES.items()}
+URBANICITY_OTHER = 0.25
+
+DEFAULT_ALPHA = ((1/3), (1/3), (1/3))
+
+def setup_utility_tables(model):
+    '''
+    Precompute the static per-county RUCA codes (once per model).
+    '''
+    model.county_ruca = np.array([RUCA_CODES.get(county.COUNTY_RUCACAT, OTHER_RUCA) for county in model.counties], dtype=np.int8)
+    update_majority_codes(model)
+
+def update_majority_codes(model):
+    '''
+    Snapshot precinct and county majorities as codes (call after update_majority).
+    '''
+    model.precinct_majority = np.array([COLOR_CODES[precinct.color] for precinct in model.precincts], dtype=np.int8)
+    model.county_majority = np.array([COLOR_CODES[county.color] for county in model.counties], dtype=np.int8)
+
+def location_utilities(model, party, precinct_idx, alpha=DEFAULT_ALPHA):
+    '''
+    Utility of voters of party (codes) living in precincts precinct_idx (vectorized
+    PersonAgent.calculate_utility).
+    '''
+    county_idx = model.space.precinct_county_idx[precinct_idx]
+    X1 = party == model.precinct_majority[precinct_idx]
+    X2 = party == model.county_majority[county_idx]
+    X3 = URBANICITY_TABLE[party, model.county_ruca[county_idx]]
+    a1, a2, a3 = alpha
+    return X1*a1 + X2*a2 + X3*a3
+
+def update_population_utilities(model):
+    '''
+    Update utility and is_unhappy of the whole array-backed population in one pass.
+    '''
+    population = model.population
+    population.utility[:] = location_utilities(model, population.party, population.precinct)
+    np.less(population.utility, model.tolerance, out=population.is_unhappy)
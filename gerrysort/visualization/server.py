@@ -38,11 +38,16 @@ model_params = {
     "ensemble_size": mesa.visualization.Slider("Number of Proposed Maps", 250, 50, 1000, 50),
     "sigma": mesa.visualization.Slider("Sigma (Temp. Gerrymandering)", 0.01, 0.00, 0.25, 0.01),
     "epsilon": mesa.visualization.Slider("Epsilon", 0.01, 0.01, 1.00, 0.01),
+    "n_chains": mesa.visualization.Slider("Number of Chains", 1, 1, 16, 1),
     "n_moving_options": mesa.visualization.Slider("Number of Moving Options", 10, 1, 20, 1),
     "distance_decay": mesa.visualization.Slider("Distance Decay", 0.0, 0.0, 1.0, 0.01),
     "capacity_mul": mesa.visualization.Slider("Capacity Multiplier", 1.0, 0.9, 2.0, 0.01),
     "intervention": mesa.visualization.Choice("Intervention", value="None", choices=["None", "Competitive", "Compact", "Both"]),
     "intervention_weight": mesa.visualization.Slider("Intervention Weight", 1.0, 0.0, 1.0, 0.01),
+    "population_mode": mesa.visualization.Choice("Population Storage", value="agents", choices=["agents", "arrays"]),
+    "sorting_mode": mesa.visualization.Choice("Sorting Mode", value="sequential", choices=["sequential", "batched"]),
+    "distance_mode": mesa.visualization.Choice("Distance Mode", value="exact", choices=["exact", "centroid"]),
+    "chain_start": mesa.visualization.Choice("Chain Start (Unbalanced Plans)", value="random", choices=["random", "warm"]),
 }
 
 def schelling_draw(agent):
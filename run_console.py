@@ -3,22 +3,41 @@ import os
 
 from gerrysort.model import GerrySort
 
+# Default (sampled) parameters
+DEFAULT_PARAMS = {
+    'sorting': True,
+    'gerrymandering': True,
+    'control_rule': 'CONGDIST',
+    'initial_control': 'Model',
+    'tolerance': 0.5,
+    'beta': 100.0,
+    'ensemble_size': 250,
+    'sigma': 0.01,
+    'n_moving_options': 10,
+    'distance_decay': 0.0,
+    'capacity_mul': 1.0,
+    'intervention': 'None',
+    'intervention_weight': 0.0
+}
+
+# Number of voter agents per state
+NPOPS = {'MN': 5800, 'WI': 5900, 'MI': 10000, 'PA': 13000, 'GA': 11000, 'TX': 30500}
+
 # Define the model wrapper for GerrySort
-def gerrysort_model(state, params, data, save=False):
+def gerrysort_model(state, params, data, save=False, print_output=True):
     """
-    Wrapper function to run the GerrySort model with sampled parameters.
+    Wrapper function to run the GerrySort model with sampled parameters
+    (missing parameters take their DEFAULT_PARAMS value).
     """
     # Set fixed parameters
-    npops = {'MN': 5800, 'WI': 5900, 'MI': 10000, 'PA': 13000, 'GA': 11000, 'TX': 30500}
-    npop = npops[state]
-    print_output = True
+    npop = NPOPS[state]
     vis_level = None
     election = 'PRES20'
     max_iters = 4
     epsilon = 0.01
 
     # Extract parameter values
-    params_values = list(params.values())
+    params = {**DEFAULT_PARAMS, **params}
 
     # Initialize the GerrySort model
     model = GerrySort(
@@ -29,18 +48,20 @@ def gerrysort_model(state, params, data, save=False):
         election=election,
         max_iters=int(max_iters),
         npop=int(npop),
-        sorting=bool(params_values[0]),
-        gerrymandering=bool(params_values[1]),
-        control_rule=params_values[2],
-        initial_control=params_values[3],
-        tolerance=float(params_values[4]),
-        beta=float(params_values[5]),
-        ensemble_size=int(params_values[6]),
+        sorting=bool(params['sorting']),
+        gerrymandering=bool(params['gerrymandering']),
+        control_rule=params['control_rule'],
+        initial_control=params['initial_control'],
+        tolerance=float(params['tolerance']),
+        beta=float(params['beta']),
+        ensemble_size=int(params['ensemble_size']),
         epsilon=float(epsilon),
-        sigma=float(params_values[7]),
-        n_moving_options=int(params_values[8]),
-        distance_decay=float(params_values[9]),
-        capacity_mul=float(params_values[10])
+        sigma=float(params['sigma']),
+        n_moving_options=int(params['n_moving_options']),
+        distance_decay=float(params['distance_decay']),
+        capacity_mul=float(params['capacity_mul']),
+        intervention=params['intervention'],
+        intervention_weight=float(params['intervention_weight'])
     )
 
     # Run the model and extract the output of interest
@@ -54,20 +75,9 @@ def gerrysort_model(state, params, data, save=False):
         
     return model_data
 
-state = 'GA'
-data = gpd.read_file(f'data/processed/{state}.geojson')
-params = {
-    'sorting': True,
-    'gerrymandering': True,
-    'control_rule': 'CONGDIST',
-    'initial_control': 'Model',
-    'tolerance': 0.5,
-    'beta': 100.0,
-    'ensemble_size': 250,
-    'sigma': 0.01,
-    'n_moving_options': 10,
-    'distance_decay': 0.0,
-    'capacity_mul': 1.0
-}
+if __name__ == '__main__':
+    state = 'GA'
+    data = gpd.read_file(f'data/processed/{state}.geojson')
+    params = dict(DEFAULT_PARAMS)
 
-model_data = gerrysort_model(state, params, data)
+    model_data = gerrysort_model(state, params, data)
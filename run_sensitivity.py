@@ -0,0 +1,51 @@
+"""
+Global sensitivity analysis (Sobol indices) of GerrySort.
+
+Draws N Saltelli blocks over the numerical GerrySort parameters (N * (D + 2) runs)
+and writes the first- and total-order indices of the chosen outputs to a CSV file.
+Runs in parallel over a local process pool, or over MPI ranks when launched with
+mpirun/mpiexec:
+
+    python run_sensitivity.py --state GA -N 1024 --workers 16
+    mpirun -n 64 python run_sensitivity.py --state GA -N 65536
+"""
+import argparse
+import json
+
+import pandas as pd
+
+from run_console import NPOPS
+from gerrysort.utils.sensitivity import PROBLEM, OUTPUTS, sobol_analysis
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--state', default='GA')
+    parser.add_argument('-N', type=int, default=1024, help='number of Saltelli blocks (a power of 2)')
+    parser.add_argument('--problem', help='JSON file with the parameter names and bounds (default: PROBLEM)')
+    parser.add_argument('--outputs', nargs='+', default=OUTPUTS)
+    parser.add_argument('--control', default='Model', choices=['Model', 'Democrats', 'Republicans', 'Fair'])
+    parser.add_argument('--intervention', default='None', choices=['None', 'Competitive', 'Compact', 'Both'])
+    parser.add_argument('--max-iters', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='local processes (default: all cores)')
+    parser.add_argument('--output', default='sobol_indices.csv')
+    args = parser.parse_args()
+
+    problem = PROBLEM
+    if args.problem:
+        with open(args.problem) as f:
+            problem = json.load(f)
+    fixed_params = {
+        'npop': NPOPS[args.state],
+        'max_iters': args.max_iters,
+        'epsilon': 0.01,
+        'initial_control': args.control,
+        'intervention': args.intervention,
+    }
+    indices = sobol_analysis(args.state, args.N, fixed_params, problem=problem, outputs=args.outputs,
+                             seed=args.seed, workers=args.workers, report_every=max(1, args.N // 20))
+    if indices is not None: # Only rank 0 reports under MPI
+        rows = [{'output': output, 'parameter': name, 'S1': result['S1'][i], 'ST': result['ST'][i]}
+                for output, result in indices.items() for i, name in enumerate(problem['names'])]
+        pd.DataFrame(rows).to_csv(args.output, index=False)
+        print(pd.DataFrame(rows).to_string(index=False))
@@ -0,0 +1,148 @@
+"""
+Parameter sweep runner for GerrySort.
+
+Runs gerrysort_model (run_console.py) for every configuration of a parameter grid
+(JSON file: parameter -> list of values, all combinations are run) or sample file
+(CSV file: one configuration per row) over a process pool, and appends each run's
+model data plus its parameters to a single results table. Every run has a key
+(state, replicate and parameters); runs that are completely in the results table are
+skipped, so an interrupted sweep is resumed by starting it again (rows of runs that were
+cut short while being appended are dropped and those runs are repeated).
+
+    python run_sweep.py --states GA MN --grid sweep.json --replicates 5 --workers 16
+"""
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from run_console import DEFAULT_PARAMS, gerrysort_model
+from gerrysort.utils.initialization import load_prepared_state
+
+# Prepared state data, loaded once per worker process
+STATE_DATA = {}
+
+def load_configurations(grid=None, samples=None):
+    """
+    Parameter configurations from a JSON grid or a CSV sample file (defaults only if neither).
+    """
+    if samples is not None:
+        # Keep 'None' (e.g. intervention) as a string; empty cells take the default
+        samples = pd.read_csv(samples, keep_default_na=False, na_values=[''])
+        configurations = [{name: value for name, value in row.items() if not pd.isna(value)} for row in samples.to_dict('records')]
+    elif grid is not None:
+        with open(grid) as f:
+            grid = json.load(f)
+        configurations = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    else:
+        configurations = [{}]
+    for params in configurations:
+        unknown = set(params) - set(DEFAULT_PARAMS)
+        if unknown:
+            raise ValueError(f'Unknown parameters: {sorted(unknown)}')
+    return [{**DEFAULT_PARAMS, **params} for params in configurations]
+
+def run_key(state, params, replicate):
+    """
+    Key identifying a run (also used to seed it).
+    """
+    text = json.dumps({'state': state, 'replicate': replicate, **params}, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+def completed_runs(output):
+    """
+    Keys of the runs that are completely in the results table (all run_rows rows). A
+    last line that was cut short and the rows of incomplete runs are removed from the
+    table, so those runs are run again.
+    """
+    if not os.path.exists(output):
+        return set()
+    with open(output, 'rb') as f:
+        content = f.read()
+    # Drop a last line without its newline (append cut short)
+    complete = content[:content.rfind(b'\n') + 1]
+    if not complete:
+        os.remove(output)
+        return set()
+    table = pd.read_csv(io.BytesIO(complete), dtype=str, keep_default_na=False)
+    rows = table.groupby('run_key').size()
+    if 'run_rows' not in table:
+        # Table written without run sizes: every run in it counts as complete
+        return set(rows.index)
+    expected = pd.to_numeric(table.groupby('run_key')['run_rows'].first(), errors='coerce')
+    done = set(rows.index[rows == expected])
+    if len(complete) < len(content) or len(done) < len(rows):
+        print(f'Removing partly appended rows from {output} ({len(rows) - len(done)} incomplete runs)')
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(output) or '.', suffix='.tmp', delete=False, newline='') as f:
+            table[table['run_key'].isin(done)].to_csv(f, index=False)
+        os.replace(f.name, output)
+    return done
+
+def run(state, params, replicate, key):
+    """
+    Run one configuration (in a worker process) and return its model data with the
+    run key, state, replicate, parameters, step, runtime and number of rows of the run
+    (run_rows, used to detect runs that were only partly appended) as leading columns.
+    """
+    if state not in STATE_DATA:
+        STATE_DATA[state] = load_prepared_state(state)
+    # Seed from the run key, so a run is reproducible
+    seed = int(key[:8], 16)
+    random.seed(seed)
+    np.random.seed(seed)
+    start = time.perf_counter()
+    model_data = gerrysort_model(state, params, STATE_DATA[state], print_output=False)
+    runtime = time.perf_counter() - start
+    columns = {'run_key': key, 'state': state, 'replicate': replicate, **params,
+               'step': range(len(model_data)), 'runtime': runtime, 'run_rows': len(model_data)}
+    return pd.concat([pd.DataFrame(columns, index=model_data.index), model_data], axis=1)
+
+def run_sweep(states, configurations, replicates=1, output='sweep_results.csv', workers=None):
+    """
+    Run every (state, configuration, replicate) not yet in output over a process pool,
+    appending results to output as runs finish.
+    """
+    done = completed_runs(output)
+    runs = [(state, params, replicate, run_key(state, params, replicate))
+            for state in states for params in configurations for replicate in range(replicates)]
+    todo = [args for args in runs if args[3] not in done]
+    print(f'{len(runs)} runs, {len(runs) - len(todo)} already completed, {len(todo)} to go')
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run, *args): args for args in todo}
+        for i, future in enumerate(as_completed(futures), start=1):
+            state, _, replicate, key = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                failed += 1
+                print(f'[{i}/{len(todo)}] run {key} ({state}, replicate {replicate}) failed: {e!r}')
+                continue
+            results.to_csv(output, mode='a', header=not os.path.exists(output), index=False)
+            print(f'[{i}/{len(todo)}] run {key} ({state}, replicate {replicate}) done in {results["runtime"].iloc[0]:.1f}s')
+    print(f'Sweep done: {len(todo) - failed} runs completed, {failed} failed (rerun to retry)')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--states', nargs='+', default=['GA'])
+    configuration_source = parser.add_mutually_exclusive_group()
+    configuration_source.add_argument('--grid', help='JSON file mapping parameters to lists of values')
+    configuration_source.add_argument('--samples', help='CSV file with one configuration per row')
+    parser.add_argument('--replicates', type=int, default=1)
+    parser.add_argument('--output', default=os.path.join('data', 'sweeps', 'sweep_results.csv'))
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    args = parser.parse_args()
+
+    configurations = load_configurations(grid=args.grid, samples=args.samples)
+    run_sweep(args.states, configurations, replicates=args.replicates, output=args.output, workers=args.workers)